@@ -0,0 +1,87 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""Benchmark of the JSON backends of judo_json (json, ujson, orjson, as far as installed).
+
+For every backend and device count it measures parsing the "get device data" response of one account,
+encoding the state documents of all devices, and the complete poll cycle of bench_pipeline.py:
+
+    python3 benchmarks/bench_json.py --devices 1 10 100 1000 --output bench_json.json
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import bench_pipeline
+import judo_json
+from judo_logging import LOGGER_NAME
+from judo_mock_server import MockAccount
+
+
+def measure(function, repeat):
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - start)
+    return statistics.median(durations) * 1000
+
+
+def bench(n_devices, cycles, backends):
+    account = MockAccount(n_devices, speed=3600, seed=1)
+    body = json.dumps(account.device_data()).encode("utf-8")
+    devices = bench_pipeline.create_devices(account, bench_pipeline.StubMQTTClient(), False, "json")
+    bench_pipeline.run_cycle(body, devices)
+    documents = [{entity.name: str(entity.value) for entity in device.entities} for device in devices]
+
+    results = {"devices": n_devices, "response_bytes": len(body), "backends": {}}
+    for name in backends:
+        # the modules look up judo_json.loads/dumps at call time
+        judo_json.loads, judo_json.dumps = judo_json.backend(name)
+        results["backends"][name] = {
+            "parse_ms": measure(lambda: judo_json.loads(body), cycles),
+            "encode_ms": measure(lambda: [judo_json.dumps(document) for document in documents], cycles),
+            "cycle_ms": bench_pipeline.bench(n_devices, cycles, 3, False, "json")["latency_ms"]["p50"],
+        }
+    judo_json.loads, judo_json.dumps = judo_json.backend(judo_json.BACKEND)
+
+    baseline = results["backends"]["json"]["cycle_ms"]
+    for name, result in results["backends"].items():
+        result["cycle_saving_ms"] = baseline - result["cycle_ms"]
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark of the JSON backends")
+    parser.add_argument("--devices", type=int, nargs="+", default=[1, 10, 100, 1000])
+    parser.add_argument("--cycles", type=int, default=20, help="measured repetitions per device count")
+    parser.add_argument("--output", help="JSON result file, printed to stdout if omitted")
+    args = parser.parse_args(argv)
+    logging.getLogger(LOGGER_NAME).addHandler(logging.NullHandler())
+    logging.getLogger(LOGGER_NAME).propagate = False
+
+    backends = judo_json.available_backends()
+    results = {
+        "benchmark": "json",
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "backends": backends,
+        "results": [bench(n, args.cycles, backends) for n in args.devices],
+    }
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""Benchmark of one poll cycle (parse response, update_entities, publish_entities) for many devices.
+
+The "get device data" responses are generated by judo_mock_server.MockAccount, MQTT publishes go to
+a stub client. Results are written as JSON, e.g. to compare them over time:
+
+    python3 benchmarks/bench_pipeline.py --devices 1 10 100 1000 --output bench_output.json
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "python"))
+try:
+    import config_getjudo
+except ImportError:
+    # no local configuration, the defaults are good enough for benchmarking
+    import config_getjudo_default as config_getjudo
+    sys.modules["config_getjudo"] = config_getjudo
+
+import judo_json
+from judo_device import JudoDeviceConfig
+from judo_logging import LOGGER_NAME
+from judo_mock_server import MockAccount
+from judo_registry import DeviceRegistry
+
+
+class StubMQTTClient():
+    """Counts the publishes instead of sending them."""
+    def __init__(self):
+        self.messages = 0
+        self.bytes = 0
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        self.messages += 1
+        self.bytes += len(payload) if payload is not None else 0
+
+
+def create_devices(account, client, only_changes, state_topic_mode, slow_update_interval=0):
+    devices = []
+    for mock_device in account.devices:
+        device_dict = dict(config_getjudo.DEVICES[0])
+        device_dict["NAME"] = f"Judo_{mock_device.serialnumber}"
+        device_dict["SERIAL_NUMBER"] = mock_device.serialnumber
+        device = JudoDeviceConfig(
+            availability_topic=f"{config_getjudo.LOCATION}/status",
+            MQTT_DEBUG_LEVEL=0,
+            PUBLISH_ONLY_CHANGES=only_changes, STATE_TOPIC_MODE=state_topic_mode,
+            SLOW_UPDATE_INTERVAL=slow_update_interval, **device_dict)
+        device.setup_entities()
+        device._client = client
+        devices.append(device)
+    return DeviceRegistry(devices)
+
+
+def run_cycle(body, devices):
+    # same steps as handle_device_data() in getjudo.py
+    response_json = judo_json.loads(body)
+    for device, response_data, _ in devices.match(response_json["data"]):
+        device.save_data.da = response_data["data"][0]["da"]
+        device.save_data.dt = response_data["data"][0]["dt"]
+        device.update_entities(response_data, False)
+        device.publish_entities()
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def bench(n_devices, cycles, variants, only_changes, state_topic_mode, slow_update_interval=0):
+    account = MockAccount(n_devices, speed=3600, seed=1)
+    bodies = []
+    for _ in range(variants):
+        bodies.append(json.dumps(account.device_data()).encode("utf-8"))
+        time.sleep(0.01)    # let the simulated water flow
+    client = StubMQTTClient()
+    # memory held by the devices and their entities
+    tracemalloc.start()
+    devices = create_devices(account, client, only_changes, state_topic_mode, slow_update_interval)
+    device_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    run_cycle(bodies[0], devices)   # warm up
+    client.messages = client.bytes = 0
+    durations = []
+    for i in range(cycles):
+        start = time.perf_counter()
+        run_cycle(bodies[i % variants], devices)
+        durations.append(time.perf_counter() - start)
+    published = (client.messages, client.bytes)
+
+    tracemalloc.start()
+    run_cycle(bodies[cycles % variants], devices)
+    current, peak = tracemalloc.get_traced_memory()
+    snapshot = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    allocated = sum(stat.size for stat in snapshot.statistics("filename"))
+
+    return {
+        "devices": n_devices,
+        "cycles": cycles,
+        "response_bytes": sum(len(body) for body in bodies) // variants,
+        "latency_ms": {
+            "mean": statistics.mean(durations) * 1000,
+            "p50": percentile(durations, 50) * 1000,
+            "p90": percentile(durations, 90) * 1000,
+            "p99": percentile(durations, 99) * 1000,
+            "max": max(durations) * 1000,
+        },
+        "per_device_us": statistics.mean(durations) / n_devices * 1e6,
+        "device_bytes": device_bytes // n_devices,
+        "alloc_peak_bytes": peak,
+        "alloc_retained_bytes": allocated,
+        "mqtt_messages_per_cycle": published[0] / cycles,
+        "mqtt_bytes_per_cycle": published[1] / cycles,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark of the decode/publish pipeline")
+    parser.add_argument("--devices", type=int, nargs="+", default=[1, 10, 100, 1000])
+    parser.add_argument("--cycles", type=int, default=20, help="measured cycles per device count")
+    parser.add_argument("--variants", type=int, default=3, help="number of different responses cycled through")
+    parser.add_argument("--only-changes", action="store_true", help="benchmark with PUBLISH_ONLY_CHANGES")
+    parser.add_argument("--state-topic-mode", choices=["json", "entity"], default="json", help="STATE_TOPIC_MODE of the devices")
+    parser.add_argument("--slow-update-interval", type=float, default=0, help="SLOW_UPDATE_INTERVAL of the devices, the slow registers are decoded once per run with a long interval")
+    parser.add_argument("--output", help="JSON result file, printed to stdout if omitted")
+    args = parser.parse_args(argv)
+    # notifications are logged, that is part of the cost but not of the output
+    logging.getLogger(LOGGER_NAME).addHandler(logging.NullHandler())
+    logging.getLogger(LOGGER_NAME).propagate = False
+
+    results = {
+        "benchmark": "pipeline",
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "json_backend": judo_json.BACKEND,
+        "only_changes": args.only_changes,
+        "state_topic_mode": args.state_topic_mode,
+        "slow_update_interval": args.slow_update_interval,
+        "results": [bench(n, args.cycles, args.variants, args.only_changes, args.state_topic_mode, args.slow_update_interval) for n in args.devices],
+    }
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
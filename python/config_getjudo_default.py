@@ -4,6 +4,13 @@
 #Judo Config
 JUDO_USER = "myjudousername"
 JUDO_PASSWORD = "myjudopassword"
+# Further myjudo.eu accounts, the devices select theirs with ACCOUNT = "<name>" (without ACCOUNT: JUDO_USER/JUDO_PASSWORD)
+# e.g. JUDO_ACCOUNTS = {"customer_a": dict(JUDO_USER="user_a", JUDO_PASSWORD="password_a")}
+JUDO_ACCOUNTS = {}
+ACCOUNT_CONNECTIONS = 2             #Max. open connections to myjudo.eu per account (polling and commands)
+POLL_CONCURRENCY = 4                #Max. number of accounts polled at the same time
+TOKEN_MAX_AGE = 0                   #The token is renewed after x seconds, 0 = before the typical lifetime of previous tokens runs out (and whenever it is rejected)
+JUDO_BASE_URL = "https://www.myjudo.eu/interface/"     #URL of the myjudo.eu interface, e.g. "http://localhost:8080/interface/" for judo_mock_server.py
 
 #MQTT Config
 BROKER = "192.168.1.2"              #Broker IP
@@ -16,6 +23,20 @@ PORT = 1883                         #MQTT PORT, 1883 default standard, 8883 if u
 #General Config
 LOCATION = "my_location"            #Location of Judo device
 STATE_UPDATE_INTERVAL = 20          #Update interval in seconds
+SLOW_UPDATE_INTERVAL = 3600         #Revision, salt and battery values (registers 7/93/94) change rarely, they are decoded only every x seconds and after a regeneration, 0 = with every update
+ERROR_MESSAGES_INTERVAL = 60        #The warnings and errors of the devices are fetched every x seconds (at the earliest with the next update), 0 = with every update
+RUNTIME_MODE = "threaded"           #"threaded": requests are sent one after another by a timer thread, "asyncio": requests are sent concurrently by an asyncio event loop
+ADAPTIVE_POLLING = False            #Set true to poll fast while water is flowing, a regeneration is running or after a command, and slow down while the device is idle (see POLL_INTERVAL_MIN/MAX of the devices)
+PUBLISH_ONLY_CHANGES = True         #Skip publishing the state if no value has changed (numeric values within their deadband count as unchanged)
+FORCED_REFRESH_INTERVAL = 600       #The full state is published at least every x seconds, even without changes
+STATE_TOPIC_MODE = "json"           #"json": all values in one JSON document on <LOCATION>/<NAME>/state, "entity": every value on its own topic <LOCATION>/<NAME>/state/<entity> (less traffic with PUBLISH_ONLY_CHANGES)
+COMMAND_COALESCE_WINDOW = 1         #Commands for the same setting within x seconds are merged, only the last value is sent (e.g. while moving a slider)
+COMMAND_RETRIES = 3                 #Number of retries of a command after network errors
+CONFIRMATION_DELAY = 5              #After a command the new value is shown immediately and confirmed by polling the device x seconds later
+DISCOVERY_SETTLE_TIME = 2           #After connecting, the discovery configs retained on the broker are collected for x seconds, only missing or changed ones are published
+METRICS_PORT = 0                    #Port of the Prometheus metrics endpoint http://<host>:<port>/metrics, 0 = disabled
+STAGE_TIMING = False                #Set true to measure the duration of every stage of the poll cycle and of commands (judo_stage_duration_seconds on the metrics endpoint, written with the profiles)
+PROFILE_CYCLES = 10                 #Number of poll cycles profiled with cProfile after "kill -USR1 <pid>" or a message to <LOCATION>/profile (payload: number of cycles, optional)
 AVAILABILITY_ONLINE = "online"
 AVAILABILITY_OFFLINE = "offline"
 
@@ -35,6 +56,10 @@ DEVICES = [
         # associated serial number will be published to the notification topic upon first connection
         # in case of multiple devices, it is highly recommended to set the serial number to ensure correct and consistent matching
         SERIAL_NUMBER = "",
+
+        # Name of the account in JUDO_ACCOUNTS the device belongs to, "" = JUDO_USER/JUDO_PASSWORD
+        # without serial number, the order of the devices of the same account is used
+        ACCOUNT = "",
         
         # The maximum slider values that can be set for leakage protection can be limited here. 
         # The limitation can be useful to improve the handling of the sliders in the Homeassistant. 
@@ -47,21 +72,44 @@ DEVICES = [
         SODIUM_LIMIT = 200,                  #Sodium limit value. Default 200mg/L (Germany)
 
         #Set this Flag to True, if you've a Judo Softwell P. There are no functions for leakage protection, no battery-,salt- & softwatersensor
-        USE_WITH_SOFTWELL_P = False
+        USE_WITH_SOFTWELL_P = False,
+
+        # Only used with ADAPTIVE_POLLING = True: poll interval while the device is active
+        # and maximum interval the polling slows down to while the device is idle [s]
+        POLL_INTERVAL_MIN = 2,
+        POLL_INTERVAL_MAX = 300
     ),
     ]
 #Error- and warning messages of plant published to notification topic ( LOCATION/NAME/notify ). Can be used for hassio telegram bot..
 LANGUAGE = "DE"                     # "DE" / "ENG"
 MQTT_DEBUG_LEVEL = 2                # 0=0ff, 1=Judo-Warnings/Errors, 2=Command feedback  3=Script Errors, Exceptions
-MAX_RETRIES = 3
+MAX_RETRIES = 3                     #After x failed requests in a row, requests to myjudo.eu are paused and the devices are shown as unavailable
+BACKOFF_MIN = 20                    #First pause in seconds, doubled after every failed attempt up to BACKOFF_MAX
+BACKOFF_MAX = 900
+BACKOFF_JITTER = 0.2                #The pauses vary randomly by ±20 %, so several bridges do not retry at the same time
+LOG_LEVEL = ""                      #"DEBUG", "INFO", "WARNING" or "ERROR", empty: derived from MQTT_DEBUG_LEVEL (0/1=WARNING, 2=INFO, 3=DEBUG)
+LOG_FILE = ""                       #Additionally log to this file (rotated at 1 MB), empty: only stdout
+LOG_RATE_LIMIT = 300                #Identical warnings and errors are logged only once within x seconds
 
 #The environment in which the script will run. Select "True" if you want to run it in the Appdeamon, or set "False" if you want to run the script on a generic Linux.
 RUN_IN_APPDEAMON = True
 
 #-------------------------------------------------------------------------------
 
-# for Appdaemon the whole path is required "/config/appdaemon/apps/main/temp_getjudo.pkl", otherwise "temp_getjudo.pkl"
+# for Appdaemon the whole path is required "/config/appdaemon/apps/main/state_getjudo.db", otherwise "state_getjudo.db"
+# TEMP_FILE is the storage of older versions, its content is taken over once if STATE_FILE does not exist yet
 if RUN_IN_APPDEAMON == True:
+    STATE_FILE = "/config/apps/main/state_getjudo.db"
     TEMP_FILE = "/config/apps/main/temp_getjudo.pkl"
+    HISTORY_DIR = "/config/apps/main/history"
+    PROFILE_DIR = "/config/apps/main/profiles"
 else:
+    STATE_FILE = "state_getjudo.db"
     TEMP_FILE = "temp_getjudo.pkl"
+    HISTORY_DIR = "history"
+    PROFILE_DIR = "profiles"
+
+# The history of all values is recorded to HISTORY_DIR (one file per device, raw values and minute/hour/day means)
+# Export with: python3 judo_history.py history/<serial number>.hist <entity name> --tier hour
+# Set HISTORY_DIR = "" to disable the recording
+HISTORY_SAVE_INTERVAL = 300         #The new values are written to disk every x seconds (only the changed parts of the files)
@@ -1,85 +1,152 @@
 #!/usr/bin/python3
 # -*- coding: utf-8 -*-
 import urllib3
-import json
+import judo_json
 import sys
 import config_getjudo
+import judo_config
+# settings added by newer versions are taken from the defaults if config_getjudo.py does not set them
+try:
+    import config_getjudo_default
+    default_settings = judo_config.apply_defaults(config_getjudo, config_getjudo_default)
+except ImportError:
+    # renamed to config_getjudo.py instead of copied
+    default_settings = []
 import messages_getjudo
-import hashlib
 from paho.mqtt import client as mqtt
 from datetime import datetime
 import pickle
-from threading import Timer
+from threading import Thread, Event
+import asyncio
+from functools import partial
+import signal
+import threading
+import time
 from judo_device import JudoDeviceConfig
-
-
-class Function_Caller(Timer):
-    def run(self):
-        while not self.finished.wait(self.interval):  
-            self.function()
+from judo_scheduler import PollScheduler, wait_any
+from judo_state import StateStore
+from judo_history import HistoryRecorder
+from judo_cloud import JudoCloudClient
+from judo_registry import DeviceRegistry
+from judo_session import JudoAccount, SessionManager, LoginError, new_account_state
+from judo_circuit import CircuitBreaker, CircuitOpenError, CLOSED, OPEN, HALF_OPEN
+from judo_events import ErrorHistory, event_id, event_text
+from judo_discovery import DiscoveryPublisher
+import judo_metrics
+from judo_profiling import Spans, Profiler
+import judo_logging
 
 
 def on_connect(client, userdata, flags, rc):
     if rc == 0:
-        print(messages_getjudo.debug[1])
+        log.info(messages_getjudo.debug[1])
         for device in devices:
             client.subscribe(device.command_topic)
-        print(messages_getjudo.debug[2])
+        client.subscribe(profile_topic)
+        log.info(messages_getjudo.debug[2])
         
         client.publish(availability_topic, config_getjudo.AVAILABILITY_ONLINE, qos=0, retain=True)
-
         for device in devices:
-            for entity in device.entities:
-                entity.send_entity_autoconfig()
-            device.notify.send_autoconfig()
+            device.publish_availability()
 
-        print(messages_getjudo.debug[3])
+        # only the configs not yet retained on the broker are published, after a short settle time
+        discovery.on_connect()
     else:
-        print(messages_getjudo.debug[4].format(rc))
+        log.error(messages_getjudo.debug[4].format(rc))
+
+
+def on_publish(client, userdata, mid):
+    metrics.inc("judo_mqtt_publishes_total")
 
 
 #Callback
 def on_message(client, userdata, message):
-    print(messages_getjudo.debug[5].format(message.topic, message.payload))
+    if discovery.handles(message.topic):
+        # retained discovery config, compared before publishing the own ones
+        discovery.on_message(message)
+        return
+    if message.topic == profile_topic:
+        start_profiling(message.payload)
+        return
+    log.info(messages_getjudo.debug[5].format(message.topic, message.payload))
     try:
-        for device in devices:
-            if message.topic == device.command_topic:
-                # relevant device found
-                break
+        device = devices.by_command_topic.get(message.topic)
+        if device is None:
+            log.warning(messages_getjudo.debug[6])
+            return
+        if event_loop is not None:
+            asyncio.run_coroutine_threadsafe(async_command(device, userdata, message), event_loop)
         else:
-            # ToDo
-            device.notify.publish([messages_getjudo.debug[27].format(sys.exc_info()[-1].tb_lineno),e], 3)
-        device.on_message(userdata, message)
+            device.on_message(userdata, message)
+        # poll faster for a while to show the result of the command
+        device._scheduler.command_sent(device)
 
     except Exception as e:
         device.notify.publish([messages_getjudo.debug[27].format(sys.exc_info()[-1].tb_lineno),e], 3)
 
 
-def judo_login(username, password):
-    pwmd5 = hashlib.md5(password.encode("utf-8")).hexdigest()
+def start_profiling(cycles=b""):
+    # payload of the MQTT message or nothing: number of cycles to profile
     try:
-        login_response = http.request('GET', f"https://www.myjudo.eu/interface/?group=register&command=login&name=login&user={username}&password={pwmd5}&nohash=Service&role=customer")
-        login_response_json = json.loads(login_response.data)
-        if "token" in login_response_json:
-            print(messages_getjudo.debug[22].format(login_response_json['token']))
-            # update token in all device instances
-            for device in devices:
-                device.save_data.token = login_response_json['token']
-                mydata["devices"][device.SERIAL_NUMBER] = device.save_data
-            mydata["token"] = login_response_json['token']
+        cycles = int(cycles or config_getjudo.PROFILE_CYCLES)
+    except ValueError:
+        cycles = config_getjudo.PROFILE_CYCLES
+    profiler.start(cycles)
+    log.info(messages_getjudo.debug[49].format(cycles))
+
+
+def on_circuit_change(account, old_state, new_state):
+    if new_state == OPEN:
+        message = messages_getjudo.debug[52].format(account.breaker.retry_in())
+        if old_state == CLOSED:
+            for device in account.devices:
+                device.notify.publish(message, 1)
+                device.publish_availability(False)
         else:
-            for device in devices:
-                device.notify.publish(messages_getjudo.debug[21], 2)
-            sys.exit()
+            # the probe failed, no notification for every attempt
+            account.log.info(message)
+    elif new_state == CLOSED:
+        for device in account.devices:
+            device.notify.publish(messages_getjudo.debug[53], 1)
+            device.publish_availability(True)
+
+
+def circuit_metrics():
+    states = {CLOSED: 0, HALF_OPEN: 0.5, OPEN: 1}
+    for account in sessions:
+        yield "judo_circuit_state", {"account": account.name or "default"}, states[account.breaker.state]
+
+
+def judo_login(account):
+    # no exit if the login fails, it is repeated with the next request
+    try:
+        account.login()
+        return True
+    except LoginError:
+        for device in account.devices:
+            device.notify.publish(messages_getjudo.debug[21], 2)
     except Exception as e:
-        for device in devices:
+        for device in account.devices:
             device.notify.publish([messages_getjudo.debug[28].format(sys.exc_info()[-1].tb_lineno),e], 3)
-        sys.exit()
+    return False
 
 
 #----- INIT ----
+log = judo_logging.setup_logging(
+    judo_logging.log_level(config_getjudo.LOG_LEVEL, config_getjudo.MQTT_DEBUG_LEVEL),
+    config_getjudo.LOG_FILE, config_getjudo.LOG_RATE_LIMIT)
+log.debug("JSON backend: %s", judo_json.BACKEND)
+if default_settings:
+    log.debug("Default settings: %s", ", ".join(default_settings))
+if config_getjudo.USE_MQTT_AUTH:
+    judo_logging.add_secret(config_getjudo.MQTTPASSWD)
 user_agent = {'user-agent':'Mozilla'}
-http = urllib3.PoolManager(10, headers=user_agent)
+metrics = judo_metrics.Metrics()
+
+# the account "" is JUDO_USER/JUDO_PASSWORD, further accounts are selected by ACCOUNT in DEVICES
+account_credentials = {"": dict(JUDO_USER=config_getjudo.JUDO_USER, JUDO_PASSWORD=config_getjudo.JUDO_PASSWORD)}
+account_credentials.update(config_getjudo.JUDO_ACCOUNTS)
+account_devices = {}
 
 # Create a list of JudoDeviceConfig instances from the configuration
 devices: list[JudoDeviceConfig] = []
@@ -92,11 +159,59 @@ else:
 for device_dict in config_getjudo.DEVICES:
     device = JudoDeviceConfig(
         availability_topic=availability_topic,
-        MQTT_DEBUG_LEVEL=config_getjudo.MQTT_DEBUG_LEVEL, **device_dict)
-    device._http = http
+        MQTT_DEBUG_LEVEL=config_getjudo.MQTT_DEBUG_LEVEL,
+        PUBLISH_ONLY_CHANGES=config_getjudo.PUBLISH_ONLY_CHANGES,
+        FORCED_REFRESH_INTERVAL=config_getjudo.FORCED_REFRESH_INTERVAL,
+        STATE_TOPIC_MODE=config_getjudo.STATE_TOPIC_MODE,
+        COMMAND_COALESCE_WINDOW=config_getjudo.COMMAND_COALESCE_WINDOW,
+        COMMAND_RETRIES=config_getjudo.COMMAND_RETRIES,
+        CONFIRMATION_DELAY=config_getjudo.CONFIRMATION_DELAY,
+        SLOW_UPDATE_INTERVAL=config_getjudo.SLOW_UPDATE_INTERVAL, **device_dict)
+    if device.ACCOUNT not in account_credentials:
+        sys.exit(messages_getjudo.debug[51].format(device.ACCOUNT, device.NAME))
+    account_devices.setdefault(device.ACCOUNT, []).append(device)
     devices.append(device)
+# index the devices by command topic and serial number
+devices = DeviceRegistry(devices)
+
+# every account gets its own connection pool, blocking instead of opening more than ACCOUNT_CONNECTIONS sockets,
+# and its own poll scheduler, a command for a device of one account does not speed up the polling of the others
+accounts = []
+poll_wakeup = Event()   # set by request_poll() of any scheduler
+for name, account_devices_list in account_devices.items():
+    credentials = account_credentials[name]
+    judo_logging.add_secret(credentials["JUDO_PASSWORD"])
+    http = urllib3.PoolManager(1, headers=user_agent, maxsize=config_getjudo.ACCOUNT_CONNECTIONS, block=True)
+    cloud = JudoCloudClient(http, config_getjudo.JUDO_BASE_URL, metrics)
+    for device in account_devices_list:
+        device._cloud = cloud
+    breaker = CircuitBreaker(config_getjudo.MAX_RETRIES, config_getjudo.BACKOFF_MIN, config_getjudo.BACKOFF_MAX, config_getjudo.BACKOFF_JITTER)
+    scheduler = PollScheduler(account_devices_list, config_getjudo.STATE_UPDATE_INTERVAL, config_getjudo.ADAPTIVE_POLLING, wakeup=poll_wakeup)
+    account = JudoAccount(name, credentials["JUDO_USER"], credentials["JUDO_PASSWORD"], cloud, account_devices_list, config_getjudo.TOKEN_MAX_AGE, breaker,
+                          ErrorHistory(config_getjudo.ERROR_MESSAGES_INTERVAL), scheduler,
+                          min_token_lifetime=3*config_getjudo.STATE_UPDATE_INTERVAL)   # shorter lifetimes are no expiry, relogin on rejection is enough
+    breaker.on_change = partial(on_circuit_change, account)
+    for device in account_devices_list:
+        device._account = account
+        device._scheduler = scheduler
+    accounts.append(account)
+sessions = SessionManager(accounts, config_getjudo.POLL_CONCURRENCY)
+metrics.collectors.append(circuit_metrics)
+metrics.collectors.append(judo_metrics.device_collector(devices))
+spans = Spans(config_getjudo.STAGE_TIMING)
+metrics.collectors.append(spans.collect)
+profiler = Profiler(config_getjudo.PROFILE_DIR, spans)
+profile_topic = f"{config_getjudo.LOCATION}/profile"
+for device in devices:
+    device._spans = spans
+
+event_loop = None  # running asyncio loop, only used with RUNTIME_MODE = "asyncio"
+stop_polling = Event()
+recorder = None
+if config_getjudo.HISTORY_DIR != "":
+    recorder = HistoryRecorder(config_getjudo.HISTORY_DIR, config_getjudo.HISTORY_SAVE_INTERVAL)
 
-mydata = {"token": 0, "day_today": "", "last_err_id": "", "devices": {}}
+mydata = {"accounts": {}, "devices": {}}
 
 # Setting up all entities for homeassistant
 for device in devices:
@@ -106,29 +221,43 @@ try:
     client = mqtt.Client()
     client.on_connect = on_connect
     client.on_message = on_message
+    client.on_publish = on_publish
     if config_getjudo.USE_MQTT_AUTH:
         client.username_pw_set(config_getjudo.MQTTUSER, config_getjudo.MQTTPASSWD)
     client.will_set(availability_topic, config_getjudo.AVAILABILITY_OFFLINE, qos=0, retain=True)
     if config_getjudo.USE_MQTT_TLS:
         # default TLS settings require a valid certificate
         client.tls_set()
+    discovery = DiscoveryPublisher(client, devices, config_getjudo.DISCOVERY_SETTLE_TIME)
+    # the callbacks may use the client as soon as the connection is established
+    for device in devices:
+        device._client = client
     client.connect(config_getjudo.BROKER, config_getjudo.PORT, 60)
     client.loop_start()
 except Exception as e:
     sys.exit(messages_getjudo.debug[33])
 
-for device in devices:
-    device._client = client
+if config_getjudo.METRICS_PORT != 0:
+    judo_metrics.serve(metrics, config_getjudo.METRICS_PORT)
+
+if hasattr(signal, "SIGUSR1") and threading.current_thread() is threading.main_thread():
+    # kill -USR1 <pid> profiles the next PROFILE_CYCLES cycles, signal handlers are only possible in the main thread
+    signal.signal(signal.SIGUSR1, lambda signum, frame: start_profiling())
 
 #Load stored variables:
-print (messages_getjudo.debug[34])
-print ("----------------------")
+log.info(messages_getjudo.debug[34])
 restore = False
+state_store = None
 try:
     if config_getjudo.RUN_IN_APPDEAMON == True:
-        # if running in AppDaemon, use the temp file to store data
-        with open(config_getjudo.TEMP_FILE, "rb") as temp_file:
-            mydata = pickle.load(temp_file)
+        # if running in AppDaemon, use the state file to store data
+        state_store = StateStore(config_getjudo.STATE_FILE)
+        stored_data = state_store.load()
+        if stored_data is None:
+            # nothing stored yet, take over the temp file of older versions
+            with open(config_getjudo.TEMP_FILE, "rb") as temp_file:
+                stored_data = pickle.load(temp_file)
+        mydata = stored_data
     for device in devices:
         try:
             device_data = mydata["devices"][device.SERIAL_NUMBER]
@@ -136,6 +265,7 @@ try:
             # if the device is not in the stored data, add it with empty data
             mydata["devices"][device.SERIAL_NUMBER] = device.save_data
             restore = True
+            continue
         try:
             # if there is some error parsing the stored data, reinitialize the device
             device.load_stored_variables(device_data)
@@ -152,8 +282,7 @@ except Exception as e:
 if restore:
     try:
         if config_getjudo.RUN_IN_APPDEAMON == True:
-            with open(config_getjudo.TEMP_FILE,"wb") as temp_file:
-                pickle.dump(mydata, temp_file)
+            state_store.flush(mydata)
             for device in devices:
                 device.notify.publish("General: " + messages_getjudo.debug[41], 3)
     except:
@@ -161,137 +290,262 @@ if restore:
             device.notify.publish(["General: " + messages_getjudo.debug[42].format(sys.exc_info()[-1].tb_lineno),e], 3)
         sys.exit()
 
-if mydata["token"] == 0:
-    judo_login(config_getjudo.JUDO_USER, config_getjudo.JUDO_PASSWORD)
+mydata.setdefault("accounts", {})
+if "token" in mydata:
+    # stored by a version with only one account, moved to the default account
+    legacy_state = {key: mydata.pop(key, "") for key in ("token", "last_err_id", "day_today")}
+    mydata["accounts"].setdefault("", legacy_state)
+for account in sessions:
+    account.state = mydata["accounts"].setdefault(account.name, new_account_state())
+    for key, value in new_account_state().items():
+        account.state.setdefault(key, value)
+    # older versions kept only the newest error id of the account, it is the starting point of its devices
+    legacy_err_id = account.state.pop("last_err_id", "")
+    last_err_id = event_id({"id": legacy_err_id})
+    for device in account.devices:
+        if last_err_id is None:
+            if legacy_err_id != "" and not device.save_data.seen_err_ids:
+                device.save_data.seen_err_ids = [str(legacy_err_id)]
+        elif not device.save_data.last_err_id:
+            device.save_data.last_err_id = last_err_id
+    judo_logging.add_secret(account.token)
+    if account.token == 0:
+        judo_login(account)
 
 
 #----- Mainthread ----
-def main():
+def request_device_data(account):
+    with spans.span("request_device_data"):
+        return account.request(account.cloud.get_device_data)
+
+
+def request_error_messages(account):
+    with spans.span("request_error_messages"):
+        return account.request(account.cloud.get_error_messages)
+
+
+def handle_device_data(account, response):
+    # response is the result of request_device_data() or the exception it raised
     error_counter = 0
     data_valid = False
-    # get device data from Judo server
+    if isinstance(response, CircuitOpenError) or (isinstance(response, Exception) and account.breaker.state != CLOSED):
+        # myjudo.eu is not reachable (already notified), the devices are offline until the circuit breaker closes again
+        return 0
+    if isinstance(response, LoginError):
+        for device in account.devices:
+            device.notify.publish(messages_getjudo.debug[21], 2)
+        return 1
     try:
-        response = http.request('GET',f"https://www.myjudo.eu/interface/?token={mydata["token"]}&group=register&command=get%20device%20data")
-        response_json = json.loads(response.data)
+        if isinstance(response, Exception):
+            raise response
         try:
-            response_json = json.loads(response.data)
+            with spans.span("parse_device_data"):
+                response_json = judo_json.loads(response.data)
             data_valid = True
         except Exception as e:
-            for device in devices:
+            for device in account.devices:
                 device.notify.publish([messages_getjudo.debug[30].format(sys.exc_info()[-1].tb_lineno),str(e) + " - "+ str(response.data)], 3)
             error_counter += 1
         if data_valid == True:
             if response_json["status"] ==  "ok":
                 today = datetime.today()
                 new_day = False
-                if today.day != mydata["day_today"]:
-                    mydata["day_today"] = today.day
+                if today.day != account.state["day_today"]:
+                    account.state["day_today"] = today.day
                     new_day = True
                 
-                for i, device in enumerate(devices):
-                    if device.SERIAL_NUMBER == "":
-                        # if no serial number is set, use the order of the devices in the config
-                        try:
-                            response_data = response_json["data"][i]
-                            device.SERIAL_NUMBER = response_data["serialnumber"] # set serial number at least for runtime to ensure consistency
-                            device.notify.publish(messages_getjudo.debug[45].format(i+1, device.SERIAL_NUMBER), 1)
-                        except IndexError:
-                            # relevant device not found in response, skip it
-                            continue
-                        except IndexError:
-                            # If the index is out of range, skip this device
-                            continue
-                    else:
-                        for response_data in response_json["data"]:
-                            if response_data["serialnumber"] == device.SERIAL_NUMBER:
-                                break
-                        else:
-                            # relevant device not found in response, skip it
-                            continue
+                for device, response_data, associated in account.devices.match(response_json["data"]):
+                    if associated:
+                        # serial number is set at least for runtime to ensure consistency
+                        device.notify.publish(messages_getjudo.debug[45].format(account.devices.devices.index(device)+1, device.SERIAL_NUMBER), 1)
                     device.save_data.da = response_data["data"][0]["da"]
                     device.save_data.dt = response_data["data"][0]["dt"]
 
-                    device.update_entities(response_data, new_day)
+                    with spans.span("update_entities"):
+                        device.update_entities(response_data, new_day)
+                    if recorder is not None:
+                        recorder.record(device)
 
                     # update mydata with the current device data
                     mydata["devices"][device.SERIAL_NUMBER] = device.save_data
 
-                    print("Publishing parsed values over MQTT....")
-                    device.publish_entities()
+                    with spans.span("publish_entities"):
+                        published = device.publish_entities()
+                    if published:
+                        device.log.debug("Publishing parsed values over MQTT....")
+                    else:
+                        device.log.debug(messages_getjudo.debug[46].format(device._changes.suppressed, device._changes.sent))
 
             elif response_json["status"] == "error":
                 error_counter += 1
                 if response_json["data"] == "login failed":
-                    for device in devices:
+                    # still rejected after a new login, the next request tries again
+                    for device in account.devices:
                         device.notify.publish(messages_getjudo.debug[23],3)
-                    judo_login(config_getjudo.JUDO_USER, config_getjudo.JUDO_PASSWORD)
                 else:
                     val = response_json["data"]
-                    for device in devices:
+                    for device in account.devices:
                         device.notify.publish(messages_getjudo.debug[24].format(val),3)
             else:
                 error_counter += 1
-                print(messages_getjudo.debug[25])
+                log.warning(messages_getjudo.debug[25])
     except Exception as e:
         error_counter += 1
-        for device in devices:
+        for device in account.devices:
             device.notify.publish([messages_getjudo.debug[31].format(sys.exc_info()[-1].tb_lineno),e],3)
+    return error_counter
 
-    # Check for error messages
+
+def handle_error_messages(account, error_response):
+    # error_response is the result of request_error_messages() or the exception it raised
+    error_counter = 0
     data_valid = False
+    if isinstance(error_response, (LoginError, CircuitOpenError)) or (isinstance(error_response, Exception) and account.breaker.state != CLOSED):
+        # already reported by handle_device_data() or on_circuit_change()
+        return error_counter
     try:
-        error_response = http.request('GET',f"https://myjudo.eu/interface/?token={mydata["token"]}&group=register&command=get%20error%20messages")
+        if isinstance(error_response, Exception):
+            raise error_response
         try:
-            error_response_json = json.loads(error_response.data)
+            with spans.span("parse_error_messages"):
+                error_response_json = judo_json.loads(error_response.data)
             data_valid = True
         except Exception as e:
             error_counter += 1
-            for device in devices:
+            for device in account.devices:
                 device.notify.publish([messages_getjudo.debug[30].format(sys.exc_info()[-1].tb_lineno),str(e) + " - "+ str(error_response.data)], 3)
         if data_valid == True:
+            if error_response_json["data"] == "login failed":
+                # still rejected after a new login, reported by the device data request
+                return error_counter
             if error_response_json["data"] != [] and error_response_json["count"] != 0:
-                # check if error message is new
-                if mydata["last_err_id"] != error_response_json["data"][0]["id"]:
-                    mydata["last_err_id"] = error_response_json["data"][0]["id"]
-
-                    timestamp = error_response_json["data"][0]["ts_sort"]
-                    timestamp = timestamp[:-7] + ": "
-
-                    # warning
-                    if error_response_json["data"][0]["type"] == "w":
-                        error_message = timestamp + messages_getjudo.warnings[error_response_json["data"][0]["error"]]
-                        for device in devices:
-                            if device.SERIAL_NUMBER == error_response_json["data"][0]["serialnumber"]:
-                                device.notify.publish(error_message, 1)
-                                break
-                    # error
-                    elif error_response_json["data"][0]["type"] == "e":
-                        error_message = timestamp + messages_getjudo.errors[error_response_json["data"][0]["error"]]
-                        for device in devices:
-                            if device.SERIAL_NUMBER == error_response_json["data"][0]["serialnumber"]:
-                                device.notify.publish(error_message, 1)
-                                break
+                # all entries since the last poll, oldest first, each to its device
+                for device, entry in account.events.new_events(account.devices, error_response_json["data"]):
+                    device.notify.publish(event_text(entry), 1)
     except Exception as e:
         error_counter += 1
-        for device in devices:
+        for device in account.devices:
             device.notify.publish([messages_getjudo.debug[30].format(sys.exc_info()[-1].tb_lineno),e], 3)
 
+    return error_counter
+
+
+def store_data():
+    error_counter = 0
     try:
         if config_getjudo.RUN_IN_APPDEAMON == True:
-            with open(config_getjudo.TEMP_FILE,"wb") as temp_file:
-                pickle.dump(mydata, temp_file)
+            # only the values changed since the last poll are written
+            state_store.flush(mydata)
+        if recorder is not None:
+            recorder.save()
     except Exception as e:
         error_counter += 1
         for device in devices:
             device.notify.publish([messages_getjudo.debug[29].format(sys.exc_info()[-1].tb_lineno),e], 3)
+    return error_counter
+
+
+def record_cycle(start, error_counter):
+    profile_file = profiler.cycle_end()
+    if profile_file is not None:
+        log.info(messages_getjudo.debug[50].format(profile_file))
+    metrics.observe("judo_poll_duration_seconds", time.perf_counter() - start)
+    metrics.set("judo_poll_errors", error_counter)
+    metrics.inc("judo_poll_errors_total", error_counter)
 
-    if error_counter >= config_getjudo.MAX_RETRIES:
-        for device in devices:
-            device.notify.publish(messages_getjudo.debug[32].format(config_getjudo.MAX_RETRIES),1)
-        sys.exit()
-#---------------------
 
-Function_Caller(config_getjudo.STATE_UPDATE_INTERVAL, main).start()
+def call(function):
+    # returns the exception instead of raising it, like asyncio.gather(return_exceptions=True)
+    try:
+        return function()
+    except Exception as e:
+        return e
+
+
+def poll_account(account):
+    error_counter = handle_device_data(account, call(partial(request_device_data, account)))
+    if account.events.due():
+        error_counter += handle_error_messages(account, call(partial(request_error_messages, account)))
+    return error_counter
+
+
+def due_accounts():
+    accounts = [account for account in sessions if account.scheduler.is_due()]
+    for account in accounts:
+        account.scheduler.start_poll()
+    return accounts
+
+
+def main():
+    # threaded mode: both requests of an account are sent one after another, the due accounts are polled concurrently
+    start = time.perf_counter()
+    profiler.cycle_start()
+    accounts = due_accounts()
+    error_counter = sum(sessions.map(poll_account, accounts))
+    with spans.span("store_data"):
+        error_counter += store_data()
+    for account in accounts:
+        account.scheduler.update()
+    record_cycle(start, error_counter)
+
+
+async def async_poll_account(account):
+    requests = [asyncio.to_thread(request_device_data, account)]
+    if account.events.due():
+        requests.append(asyncio.to_thread(request_error_messages, account))
+    responses = await asyncio.gather(*requests, return_exceptions=True)
+    error_counter = handle_device_data(account, responses[0])
+    if len(responses) > 1:
+        error_counter += handle_error_messages(account, responses[1])
+    return error_counter
+
+
+async def async_main():
+    # asyncio mode: the requests of the due accounts are sent concurrently, the cycle takes as long as the slowest one
+    start = time.perf_counter()
+    profiler.cycle_start()
+    accounts = due_accounts()
+    # like in threaded mode at most POLL_CONCURRENCY accounts at the same time
+    concurrency = asyncio.Semaphore(sessions.max_workers)
+
+    async def poll(account):
+        async with concurrency:
+            return await async_poll_account(account)
+    error_counter = sum(await asyncio.gather(*(poll(account) for account in accounts)))
+    with spans.span("store_data"):
+        error_counter += store_data()
+    for account in accounts:
+        account.scheduler.update()
+    record_cycle(start, error_counter)
+
+
+def main_loop():
+    # threaded mode: a poll cycle whenever the scheduler of an account says its next poll is due, until stop_polling is set
+    while wait_any([account.scheduler for account in sessions], stop_polling, poll_wakeup):
+        main()
+
+
+async def async_main_loop():
+    global event_loop
+    event_loop = asyncio.get_running_loop()
+    while await asyncio.to_thread(wait_any, [account.scheduler for account in sessions], stop_polling, poll_wakeup):
+        await async_main()
+
+
+async def async_command(device, userdata, message):
+    # commands are sent in a worker thread, so neither polling nor the MQTT network loop is blocked
+    await asyncio.to_thread(device.on_message, userdata, message)
+#---------------------
 
 for device in devices:
     device.notify.publish(messages_getjudo.debug[39], 2)   #Init Complete
+
+if config_getjudo.RUNTIME_MODE == "asyncio":
+    if config_getjudo.RUN_IN_APPDEAMON == True:
+        # the import from AppDaemon must not block, run the event loop in its own thread
+        Thread(target=asyncio.run, args=(async_main_loop(),), name="getjudo-asyncio").start()
+    else:
+        # run the event loop in the main thread, once it has finished no executor threads can be started
+        asyncio.run(async_main_loop())
+else:
+    Thread(target=main_loop, name="getjudo-poll").start()
@@ -0,0 +1,71 @@
+import random
+import time
+from threading import Lock
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class CircuitBreaker():
+    """Stops sending requests to myjudo.eu after failure_threshold consecutive failures.
+
+    While open, requests fail immediately. Once the backoff has passed (doubling from min_delay up to
+    max_delay, with random jitter), one probe request is let through (half open): if it succeeds the
+    circuit closes, otherwise it opens again for the next backoff step.
+    on_change(old state, new state) is called on every state change.
+    """
+    def __init__(self, failure_threshold=3, min_delay=20, max_delay=900, jitter=0.2, on_change=None):
+        self.failure_threshold = failure_threshold
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.on_change = on_change
+        self.state = CLOSED
+        self.failures = 0       # consecutive failures
+        self.opened = 0         # number of times opened since the last success, for the backoff
+        self.open_until = 0.0
+        self._lock = Lock()
+
+    def retry_in(self):
+        return max(self.open_until - time.monotonic(), 0)
+
+    def allow(self):
+        """Returns True if a request may be sent now, i.e. closed or the probe of the half open state."""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and time.monotonic() >= self.open_until:
+                self._set_state(HALF_OPEN)
+                return True
+            return False
+
+    def check(self):
+        if not self.allow():
+            raise CircuitOpenError(f"circuit open, retry in {self.retry_in():.0f} s")
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened = 0
+            if self.state != CLOSED:
+                self._set_state(CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+                delay = min(self.min_delay * 2 ** self.opened, self.max_delay)
+                delay *= 1 + random.uniform(-self.jitter, self.jitter)
+                self.opened += 1
+                self.open_until = time.monotonic() + delay
+                self._set_state(OPEN)
+
+    def _set_state(self, state):
+        old, self.state = self.state, state
+        if self.on_change is not None:
+            self.on_change(old, state)
@@ -0,0 +1,41 @@
+import time
+from urllib.parse import urlencode, quote
+
+DEFAULT_BASE_URL = "https://www.myjudo.eu/interface/"
+
+
+class JudoCloudClient():
+    """Sends the requests of the myjudo.eu interface, returns the raw HTTP responses."""
+    def __init__(self, http, base_url=DEFAULT_BASE_URL, metrics=None):
+        self.http = http    # e.g. urllib3.PoolManager()
+        self.base_url = base_url
+        self.metrics = metrics  # judo_metrics.Metrics, records latency and errors per endpoint
+
+    def request(self, **params):
+        url = self.base_url + "?" + urlencode(params, quote_via=quote)
+        if self.metrics is None:
+            return self.http.request('GET', url)
+        endpoint = params["command"].replace(" ", "_")
+        start = time.perf_counter()
+        try:
+            response = self.http.request('GET', url)
+        except Exception:
+            self.metrics.inc("judo_http_request_errors_total", endpoint=endpoint)
+            raise
+        finally:
+            self.metrics.observe("judo_http_request_duration_seconds", time.perf_counter() - start, endpoint=endpoint)
+        if response.status >= 400:
+            self.metrics.inc("judo_http_request_errors_total", endpoint=endpoint)
+        return response
+
+    def login(self, username, pwmd5):
+        return self.request(group="register", command="login", name="login", user=username, password=pwmd5, nohash="Service", role="customer")
+
+    def get_device_data(self, token):
+        return self.request(token=token, group="register", command="get device data")
+
+    def get_error_messages(self, token):
+        return self.request(token=token, group="register", command="get error messages")
+
+    def write_data(self, token, serial_number, dt, index, data, da):
+        return self.request(token=token, group="register", command="write data", serial_number=serial_number, dt=dt, index=index, data=data, da=da, role="customer")
@@ -0,0 +1,52 @@
+import time
+from threading import Condition, Thread
+
+
+class CommandQueue():
+    """Sends the commands of one device one after another from a worker thread.
+
+    Commands are queued with a key, usually the register index they write. A command replaces a
+    queued command with the same key if it arrives within coalesce_window seconds after the first
+    queued command (last writer wins), so e.g. dragging a slider results in one write only.
+    """
+    def __init__(self, name, coalesce_window=1.0, on_error=None):
+        self.coalesce_window = coalesce_window
+        self.on_error = on_error    # called with the exception if a command raised one
+        self.sent = 0           # number of executed commands
+        self.coalesced = 0      # number of commands replaced by a newer one
+        self._pending = {}      # key -> (function, args), in order of arrival
+        self._cond = Condition()
+        self._name = name
+        self._thread = None     # started with the first command
+
+    def put(self, key, function, *args):
+        with self._cond:
+            if self._thread is None:
+                self._thread = Thread(target=self._run, name=f"commands-{self._name}", daemon=True)
+                self._thread.start()
+            if key in self._pending:
+                self.coalesced += 1
+            self._pending[key] = (function, args)
+            self._cond.notify()
+
+    def __len__(self):
+        return len(self._pending)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+            # collect further commands for the same keys before sending
+            time.sleep(self.coalesce_window)
+            with self._cond:
+                commands = list(self._pending.values())
+                self._pending.clear()
+            for function, args in commands:
+                try:
+                    function(*args)
+                except Exception as e:
+                    if self.on_error is not None:
+                        self.on_error(e)
+                self.sent += 1
+
@@ -0,0 +1,25 @@
+import os
+
+# Settings of newer versions whose default depends on where the older config_getjudo.py keeps its files:
+# they are placed next to its TEMP_FILE
+_FILES_NEXT_TO_TEMP_FILE = {
+    "STATE_FILE": "state_getjudo.db",
+    "HISTORY_DIR": "history",
+    "PROFILE_DIR": "profiles",
+}
+
+
+def apply_defaults(config, defaults):
+    """Fills the settings missing in config (e.g. a config_getjudo.py of an older version) from defaults.
+
+    Returns the names of the settings taken from defaults, an upgrade needs no changes of the config this way.
+    """
+    missing = []
+    for name, value in vars(defaults).items():
+        if not name.isupper() or hasattr(config, name):
+            continue
+        if name in _FILES_NEXT_TO_TEMP_FILE and hasattr(config, "TEMP_FILE"):
+            value = os.path.join(os.path.dirname(config.TEMP_FILE), _FILES_NEXT_TO_TEMP_FILE[name])
+        setattr(config, name, value)
+        missing.append(name)
+    return missing
@@ -1,27 +1,42 @@
-import json
+import hashlib
+import logging
 import math
 import sys
 import time
 import re
+import traceback
 from dataclasses import dataclass, field
+from functools import cached_property
+from threading import RLock
+from urllib3.exceptions import HTTPError
 import messages_getjudo
+import judo_json
+from judo_registers import MetadataDecoder, register_decoders
+from judo_scheduler import Cadence
+from judo_publish import ChangeDetector
+from judo_commands import CommandQueue
+from judo_profiling import Spans
+from judo_logging import LOGGER_NAME, NOTIFY_LEVELS, redact
+from judo_circuit import CircuitOpenError
+from judo_session import LoginError
 
 @dataclass
 class JudoDeviceSafeData:
-    day_today = 0
-    offset_total_water = 0
-    last_err_id = 0
-    token = 0
-    water_yesterday = 0
-    da = 0
-    dt = 0
-    serial = 0
-    reg_mean_time = 0
-    reg_mean_counter = 1
-    reg_last_val = 0
-    reg_last_timestamp = 0
-    total_softwater_at_reg = 0
-    total_hardwater_at_reg = 0
+    day_today: int = 0
+    offset_total_water: int = 0
+    last_err_id: int = 0
+    seen_err_ids: list | tuple = ()     # non-numeric ids of the error history, see judo_events
+    token: int | str = 0
+    water_yesterday: int = 0
+    da: int = 0
+    dt: int = 0
+    serial: int = 0
+    reg_mean_time: int = 0
+    reg_mean_counter: int = 1
+    reg_last_val: int = 0
+    reg_last_timestamp: int = 0
+    total_softwater_at_reg: float = 0
+    total_hardwater_at_reg: float = 0
 
 @dataclass
 class JudoDeviceConfig:
@@ -42,30 +57,54 @@ class JudoDeviceConfig:
     USE_WITH_SOFTWELL_P: bool
     MQTT_DEBUG_LEVEL: int  # Debug level for MQTT messages
     availability_topic: str
+    ACCOUNT: str = ""  # name of the myjudo.eu account in JUDO_ACCOUNTS, "" = JUDO_USER/JUDO_PASSWORD
+    PUBLISH_ONLY_CHANGES: bool = False  # skip state publishes if no value changed by more than its deadband
+    FORCED_REFRESH_INTERVAL: int = 600  # seconds after which the state is published even without changes
+    STATE_TOPIC_MODE: str = "json"  # "json": one JSON document on state_topic, "entity": one retained topic per entity
+    POLL_INTERVAL_MIN: float = 2  # adaptive polling: poll interval while the device is active
+    POLL_INTERVAL_MAX: float = 300  # adaptive polling: maximum poll interval while the device is idle
+    COMMAND_COALESCE_WINDOW: float = 1  # seconds in which commands for the same register are merged
+    COMMAND_RETRIES: int = 3  # retries of a command after network errors
+    COMMAND_RETRY_DELAY: float = 2  # seconds before the first retry, doubled for every further retry
+    CONFIRMATION_DELAY: float = 5  # seconds after a command until the device is polled to confirm the new value
+    CONFIRMATION_TIMEOUT: float = 60  # seconds until a commanded value not reported by the device is reverted
+    SLOW_UPDATE_INTERVAL: float = 0  # seconds between decoding the slowly changing registers (SLOW_REGISTERS), 0 = every poll
 
     # not set at initialization
     entities: list['Entity'] = field(default_factory=lambda: [])
     notify: 'NotificationEntity | None' = None  # Notification entity for errors and warnings
-    _http: any  = None # HTTP client, e.g., urllib3.PoolManager()
+    _cloud: any  = None # JudoCloudClient
+    _account: any = None # JudoAccount, provides the token
+    _available: bool = True # False while myjudo.eu is not reachable
     _client: any  = None # MQTT client, e.g., paho.mqtt.client.Client()
+    _scheduler: any = None # PollScheduler, used to request confirmation polls after commands
+    _spans: Spans = field(default_factory=Spans)  # stage timing, disabled unless replaced
 
     save_data: JudoDeviceSafeData = field(default_factory=JudoDeviceSafeData)
 
-    @property
+    @cached_property
     def command_topic(self):
         return f"{self.LOCATION}/{self.NAME}/command"
 
-    @property
+    @cached_property
     def state_topic(self):
         return f"{self.LOCATION}/{self.NAME}/state"
     
-    @property
+    @cached_property
     def notification_topic(self):
         return f"{self.LOCATION}/{self.NAME}/notify"
     
-    @property
+    @cached_property
+    def device_availability_topic(self):
+        return f"{self.LOCATION}/{self.NAME}/availability"
+
+    @cached_property
     def client_id(self):
         return f"{self.NAME}-{self.LOCATION}"
+
+    @cached_property
+    def log(self):
+        return logging.getLogger(f"{LOGGER_NAME}.{self.NAME}")
     
     @property
     def entity_device_config(self):
@@ -81,23 +120,37 @@ class JudoDeviceConfig:
     def entity_config(self):
         return {
             "device": self.entity_device_config,
-            "availability_topic": self.availability_topic,
-            "payload_available": self.AVAILABILITY_ONLINE,
-            "payload_not_available": self.AVAILABILITY_OFFLINE,
+            # the bridge (last will) and the connection of the device to myjudo.eu
+            "availability": [
+                {"topic": self.availability_topic, "payload_available": self.AVAILABILITY_ONLINE, "payload_not_available": self.AVAILABILITY_OFFLINE},
+                {"topic": self.device_availability_topic, "payload_available": self.AVAILABILITY_ONLINE, "payload_not_available": self.AVAILABILITY_OFFLINE},
+            ],
+            "availability_mode": "all",
         }
 
-    def entity(self, name, icon, entity_type, unit="", minimum=1, maximum=100, step=1, value=0):
-        e = Entity(self, name, icon, entity_type, unit, minimum, maximum, step, value)
+    def entity(self, name, icon, entity_type, unit="", minimum=1, maximum=100, step=1, value=0, deadband=0):
+        if any(e.name == name for e in self.entities):
+            # would be published and auto-configured twice
+            raise ValueError(f"duplicate entity {name}")
+        e = Entity(self, name, icon, entity_type, unit, minimum, maximum, step, value, deadband)
         self.entities.append(e)
         return e
 
+    def autoconfigs(self):
+        """Yields (topic, payload, hash) of the discovery configs of all entities."""
+        for entity in self.entities:
+            autoconfig = entity.autoconfig()
+            if autoconfig is not None:
+                yield autoconfig
+        yield self.notify.autoconfig()
+
     def setup_entities(self):
         #Setting up all entities for homeassistant
         self.next_revision = self.entity(messages_getjudo.entities[0], "mdi:account-wrench", "sensor", "Tagen")
         self.total_water = self.entity(messages_getjudo.entities[1], "mdi:water-circle", "total_increasing", "m³")
         self.output_hardness = self.entity(messages_getjudo.entities[6], "mdi:water-minus", "number", "°dH", 1, 15)
         self.input_hardness = self.entity(messages_getjudo.entities[7], "mdi:water-plus", "sensor", "°dH")
-        self.water_flow = self.entity(messages_getjudo.entities[8], "mdi:waves-arrow-right", "sensor", "L/h")
+        self.water_flow = self.entity(messages_getjudo.entities[8], "mdi:waves-arrow-right", "sensor", "L/h", deadband=5)
         self.batt_capacity = self.entity(messages_getjudo.entities[9], "mdi:battery-50", "sensor", "%")
         self.regenerations = self.entity(messages_getjudo.entities[10], "mdi:water-sync", "sensor")
         self.water_lock = self.entity(messages_getjudo.entities[11], "mdi:pipe-valve", "switch")
@@ -107,6 +160,9 @@ class JudoDeviceConfig:
         
         self.h_since_last_reg = self.entity(messages_getjudo.entities[21], "mdi:water-sync", "sensor", "h")
         self.avg_reg_interval = self.entity(messages_getjudo.entities[22], "mdi:water-sync", "sensor", "h")
+        self.software_version = self.entity(messages_getjudo.entities[24], "mdi:chip", "diagnostic", value="")
+        self.hardware_version = self.entity(messages_getjudo.entities[25], "mdi:expansion-card", "diagnostic", value="")
+        self.device_number = self.entity(messages_getjudo.entities[26], "mdi:identifier", "diagnostic", value="")
 
 
         if self.USE_WITH_SOFTWELL_P == False:
@@ -114,9 +170,6 @@ class JudoDeviceConfig:
             self.salt_range = self.entity(messages_getjudo.entities[5], "mdi:chevron-triple-right", "sensor", "Tage")
             self.total_softwater_proportion = self.entity(messages_getjudo.entities[2], "mdi:water-outline", "total_increasing", "m³")
             self.total_hardwater_proportion = self.entity(messages_getjudo.entities[3], "mdi:water", "total_increasing", "m³")
-            self.water_flow = self.entity(messages_getjudo.entities[8], "mdi:waves-arrow-right", "sensor", "L/h")
-            self.batt_capacity = self.entity(messages_getjudo.entities[9], "mdi:battery-50", "sensor", "%")
-            self.water_lock = self.entity(messages_getjudo.entities[11], "mdi:pipe-valve", "switch")
             self.sleepmode = self.entity(messages_getjudo.entities[13], "mdi:pause-octagon", "number", "h", 0, 10)
             self.extraction_time = self.entity(messages_getjudo.entities[17], "mdi:clock-alert-outline", "number", "min", 10, self.LIMIT_EXTRACTION_TIME, 10)
             self.max_waterflow = self.entity(messages_getjudo.entities[18], "mdi:waves-arrow-up", "number", "L/h", 500, self.LIMIT_MAX_WATERFLOW, 500)
@@ -126,95 +179,65 @@ class JudoDeviceConfig:
 
         self.notify = NotificationEntity(self,messages_getjudo.entities[16], "mdi:alert-outline")
 
+        self._changes = ChangeDetector(self.FORCED_REFRESH_INTERVAL)
+        self._publish_lock = RLock()
+        self._expected = {}     # entity name -> (entity, commanded value, deadline), see set_optimistic()
+        self._commands = CommandQueue(self.client_id, self.COMMAND_COALESCE_WINDOW, self.on_command_error)
+
+        # the fast part of the register map is decoded on every poll, the slow part every SLOW_UPDATE_INTERVAL
+        self._decoder, self._slow_decoder = register_decoders(self.USE_WITH_SOFTWELL_P)
+        self._metadata_decoder = MetadataDecoder()
+        self._slow_cadence = Cadence(self.SLOW_UPDATE_INTERVAL)
+        self.setup_commands()
+
     def load_stored_variables(self, stored_data: JudoDeviceSafeData):
-        print (messages_getjudo.debug[35].format(stored_data.last_err_id))
-        print (messages_getjudo.debug[36].format(stored_data.water_yesterday))
+        self.save_data = stored_data
         self.water_yesterday.value = stored_data.water_yesterday
-        print (messages_getjudo.debug[37].format(stored_data.offset_total_water))
-        print (messages_getjudo.debug[38].format(stored_data.day_today))
-        print ("da: {}".format(stored_data.da))
-        print ("dt: {}".format(stored_data.dt))
-        print ("serial: {}".format(stored_data.serial))
-        print ("token: {}".format(stored_data.token))
-        print ("avergage regeneration interval: {}h".format(stored_data.reg_mean_time))
-        print ("counter for avg-calc: {}".format(stored_data.reg_mean_counter))
-        print ("last regenerations count: {}".format(stored_data.reg_last_val))
-        print ("timestamp of last regeneration: {}s".format(stored_data.reg_last_timestamp))
-        if self.USE_WITH_SOFTWELL_P == False:
-            print ("Softwater prop. since Regeneration: {}L".format(stored_data.total_softwater_at_reg))
-            print ("Hardwater prop. since Regeneration: {}L".format(stored_data.total_hardwater_at_reg))
-
+        if self.log.isEnabledFor(logging.DEBUG):
+            details = [
+                messages_getjudo.debug[35].format(stored_data.last_err_id),
+                messages_getjudo.debug[36].format(stored_data.water_yesterday),
+                messages_getjudo.debug[37].format(stored_data.offset_total_water),
+                messages_getjudo.debug[38].format(stored_data.day_today),
+                f"da: {stored_data.da}",
+                f"dt: {stored_data.dt}",
+                f"serial: {stored_data.serial}",
+                f"avergage regeneration interval: {stored_data.reg_mean_time}h",
+                f"counter for avg-calc: {stored_data.reg_mean_counter}",
+                f"last regenerations count: {stored_data.reg_last_val}",
+                f"timestamp of last regeneration: {stored_data.reg_last_timestamp}s",
+            ]
+            if self.USE_WITH_SOFTWELL_P == False:
+                details.append(f"Softwater prop. since Regeneration: {stored_data.total_softwater_at_reg}L")
+                details.append(f"Hardwater prop. since Regeneration: {stored_data.total_hardwater_at_reg}L")
+            self.log.debug(", ".join(details))
         self.avg_reg_interval.value = stored_data.reg_mean_time
 
     def update_entities(self, response_json, new_day: bool):
         try:
-            # Software version
-            val = response_json["data"][0]["data"]["1"]["data"]
-            if val != "":
-                minor = int.from_bytes(bytes.fromhex(val[2:4]), byteorder='little')
-                major = int.from_bytes(bytes.fromhex(val[4:6]), byteorder='little')
-                print("Software version: {}.{:02d}".format(major, minor))
-            # Hardware version
-            val = response_json["data"][0]["data"]["2"]["data"]
-            if val != "":
-                minor = int.from_bytes(bytes.fromhex(val[0:2]), byteorder='little')
-                major = int.from_bytes(bytes.fromhex(val[2:4]), byteorder='little')
-                print("Hardware version: {}.{:02d}".format(major, minor))
-            # Serial number
-            val = response_json["data"][0]["data"]["3"]["data"]
-            if val != "":
-                val = int.from_bytes(bytes.fromhex(val[0:8]), byteorder='little')
-                print("Gerätenummer: {}".format(val))
-
-            self.next_revision.parse(response_json, 7, 0, 4)
-            if self.USE_WITH_SOFTWELL_P == False:
-                total_water_temp = self.total_water.value * 1000
-                self.total_water.parse(response_json, 8, 0, 8)
-                if self.total_water.value < total_water_temp:
-                    self.notify.publish("Correction made - new value = "+str(total_water_temp)+" - wrong value = "+str(self.total_water.value),3)
-                    self.total_water.value = total_water_temp
-                self.salt_stock.parse(response_json,94, 0, 4)
-                self.salt_range.parse(response_json,94, 4, 8)
-                self.total_softwater_proportion.parse(response_json, 9, 0, 8)
-                self.water_flow.parse(response_json, 790, 34, 38)
-                self.batt_capacity.parse(response_json, 93, 6, 8)
-                self.water_lock.parse(response_json, 792, 2, 4)
-                self.sleepmode.parse(response_json,792, 20, 22)
-                self.max_waterflow.parse(response_json, 792, 26, 30)
-                self.extraction_quantity.parse(response_json, 792, 30, 34)
-                self.extraction_time.parse(response_json, 792, 34, 38)
-                self.holidaymode.parse(response_json,792, 38, 40)
-            else:
-                self.total_water.parse(response_json, 9, 0, 8)
-
-            self.output_hardness.parse(response_json, 790, 18, 20)
-            self.input_hardness.parse(response_json, 790, 54, 56)
-            self.regenerations.parse(response_json, 791, 62, 66)
-            self.regeneration_start.parse(response_json, 791, 2, 4)
-
-            self.next_revision.value = int(self.next_revision.value/24)   #Calculation hours to days
-            self.total_water.value =float(self.total_water.value/1000) # Calculating from L to m³
+            registers = response_json["data"][0]["data"]
+            regenerations_before = self.regenerations.value
+            total_water_before = self.total_water.value
+            with self._publish_lock:
+                values = self._decoder.decode(registers)
+                # the slow registers keep their last values in between, a regeneration changes the salt stock
+                if self._slow_cadence.due() or values.get("regenerations", regenerations_before) != regenerations_before:
+                    values.update(self._slow_decoder.decode(registers))
+                    # versions and device number, only if their registers changed
+                    metadata = self._metadata_decoder.decode(registers)
+                    if metadata:
+                        self.log.debug("Metadata: %s", metadata)
+                    values.update(metadata)
+                for name, value in values.items():
+                    getattr(self, name).value = value
+                self.reconcile_expected()
 
             if self.USE_WITH_SOFTWELL_P == False:
-                if self.holidaymode.value == 3:      #mode1
-                    self.holidaymode.value = messages_getjudo.holiday_options[2]
-                elif self.holidaymode.value == 5:    #mode2
-                    self.holidaymode.value = messages_getjudo.holiday_options[3]
-                elif self.holidaymode.value == 9:    #lock
-                    self.holidaymode.value = messages_getjudo.holiday_options[1]
-                else:                           #off
-                    self.holidaymode.value = messages_getjudo.holiday_options[0]
-
-                self.total_softwater_proportion.value = float(self.total_softwater_proportion.value/1000)# Calculating from L to m³
+                if self.total_water.value < total_water_before:
+                    self.notify.publish("Correction made - new value = "+str(total_water_before*1000)+" - wrong value = "+str(self.total_water.value*1000),3)
+                    self.total_water.value = total_water_before
                 self.total_hardwater_proportion.value = round((self.total_water.value - self.total_softwater_proportion.value),3)
-                self.salt_stock.value /= 1000
-                if self.water_lock.value > 1:
-                    self.water_lock.value = 1
 
-            self.regeneration_start.value &= 0x0F
-            if self.regeneration_start.value > 0:
-                self.regeneration_start.value = 1
-            
             if new_day:
                     # mydata.day_today = today.day
                     self.save_data.offset_total_water = int(1000*self.total_water.value)
@@ -259,25 +282,69 @@ class JudoDeviceConfig:
             self.notify.publish([messages_getjudo.debug[31].format(sys.exc_info()[-1].tb_lineno),e],3)
             raise e
 
+    def publish_availability(self, available=None):
+        if available is not None:
+            self._available = available
+        payload = self.AVAILABILITY_ONLINE if self._available else self.AVAILABILITY_OFFLINE
+        self._client.publish(self.device_availability_topic, payload, qos=0, retain=True)
+
     def publish_entities(self):
-        #Publish all entities to homeassistant
-        outp_val_dict = {}
-        for entity in self.entities:
-            outp_val_dict[entity.name] = str(entity.value)
-        publish_json(self._client, self.state_topic, outp_val_dict)
+        #Publish all entities to homeassistant, returns False if the publish was skipped
+        with self._publish_lock:
+            return self._publish_entities()
+
+    def _publish_entities(self):
+        full_refresh = self._changes.refresh_due()
+        entities = self.entities
+        if self.PUBLISH_ONLY_CHANGES and not full_refresh:
+            entities = [entity for entity in self.entities if self._changes.is_changed(entity)]
+            if not entities:
+                self._changes.mark_suppressed()
+                return False
+        if self.STATE_TOPIC_MODE == "entity":
+            # raw values, only the changed entities
+            for entity in entities:
+                self._client.publish(entity.state_topic, str(entity.value), qos=0, retain=True)
+            self._changes.mark_published(entities, full_refresh)
+        else:
+            outp_val_dict = {}
+            for entity in self.entities:
+                outp_val_dict[entity.name] = str(entity.value)
+            publish_json(self._client, self.state_topic, outp_val_dict)
+            self._changes.mark_published(self.entities, full_refresh)
+        return True
 
     def send_command(self, index, data):
-        try:
-            # ToDo: make device specific
-            cmd_response = self._http.request('GET', f"https://www.myjudo.eu/interface/?token={self.save_data.token}&group=register&command=write%20data&serial_number={self.SERIAL_NUMBER}&dt={self.save_data.dt}&index={index}&data={data}&da={self.save_data.da}&role=customer")
-            cmd_response_json = json.loads(cmd_response.data)
-            if "status" in cmd_response_json:
-                if cmd_response_json["status"] == "ok":
-                    return True
-        except Exception as e:
-            self.notify.publish([messages_getjudo.debug[27].format(sys.exc_info()[-1].tb_lineno),e], 3)
-            return False
-        return False
+        # network errors and invalid responses are retried with exponential backoff,
+        # an open circuit breaker, rejected credentials and script errors fail at once
+        for attempt in range(1, self.COMMAND_RETRIES + 2):
+            try:
+                with self._spans.span("write_data"):
+                    # the token is renewed and the command repeated once if it is rejected
+                    cmd_response = self._account.request(
+                        lambda token: self._cloud.write_data(token, self.SERIAL_NUMBER, self.save_data.dt, index, data, self.save_data.da))
+                with self._spans.span("parse_write_response"):
+                    cmd_response_json = judo_json.loads(cmd_response.data)
+                if "status" in cmd_response_json:
+                    if cmd_response_json["status"] == "ok":
+                        return True
+                self.notify.publish(messages_getjudo.debug[47].format(index, attempt), 2)
+                return False
+            except (CircuitOpenError, LoginError):
+                # myjudo.eu is unreachable or rejects the login (both already notified by the poll), a retry can't succeed now
+                self.notify.publish(messages_getjudo.debug[47].format(index, attempt), 2)
+                return False
+            except (HTTPError, OSError, ValueError) as e:
+                # ValueError: no valid JSON in the response, e.g. an error page
+                self.notify.publish([messages_getjudo.debug[27].format(sys.exc_info()[-1].tb_lineno),e], 3)
+                if attempt > self.COMMAND_RETRIES:
+                    self.notify.publish(messages_getjudo.debug[47].format(index, attempt), 2)
+                    return False
+                time.sleep(self.COMMAND_RETRY_DELAY * 2 ** (attempt - 1))
+            except Exception as e:
+                self.notify.publish([messages_getjudo.debug[27].format(sys.exc_info()[-1].tb_lineno),e], 3)
+                self.notify.publish(messages_getjudo.debug[47].format(index, attempt), 2)
+                return False
 
     def int_to_le_hex(self, integer, length):
         if length == 16:
@@ -288,98 +355,143 @@ class JudoDeviceConfig:
         else:
             self.notify.publish(messages_getjudo.debug[20], 3)
 
+    def setup_commands(self):
+        # entity name -> (key for coalescing in the command queue, handler called with the value)
+        self._command_handlers = {
+            self.output_hardness.name: (60, self.set_output_hardness),
+            self.regeneration_start.name: (65, lambda value: self.start_regeneration()),
+        }
+        if self.USE_WITH_SOFTWELL_P == False:
+            self._command_handlers.update({
+                self.salt_stock.name: (94, lambda value: self.set_value(self.salt_stock, 94, value*1000, 16, value)),
+                self.water_lock.name: (self.water_lock.name, self.set_water_lock),
+                self.sleepmode.name: (self.sleepmode.name, self.set_sleepmode),
+                self.max_waterflow.name: (75, lambda value: self.set_value(self.max_waterflow, 75, value, 16)),
+                self.extraction_time.name: (74, lambda value: self.set_value(self.extraction_time, 74, value, 16)),
+                self.extraction_quantity.name: (76, lambda value: self.set_value(self.extraction_quantity, 76, value, 16)),
+                self.holidaymode.name: (self.holidaymode.name, self.set_holidaymode),
+            })
+
     def on_message(self, userdata, message):
+        # commands are only queued here, they are sent by the worker of the command queue
         try:
-            command_json = json.loads(message.payload)
-            
-            if self.output_hardness.name in command_json:
-                if self.USE_SODIUM_CHECK == True:
-                    sodium = round(((self.input_hardness.value - command_json[self.output_hardness.name]) * 8.2) + self.SODIUM_INPUT,1)
-                    if  sodium < self.SODIUM_LIMIT:
-                        if self.send_command(str(60), self.int_to_le_hex(command_json[self.output_hardness.name], 8)):
-                            self.notify.publish(messages_getjudo.debug[43].format(sodium, self.SODIUM_LIMIT, command_json[self.output_hardness.name]), 2)
-                    else:
-                        limited_hardness = self.input_hardness.value - ((self.SODIUM_LIMIT - self.SODIUM_INPUT)/8.2)
-                        limited_hardness = math.ceil(limited_hardness) #round up
-                        if self.send_command(str(60), self.int_to_le_hex(limited_hardness, 8)):
-                            self.notify.publish(messages_getjudo.debug[44].format(limited_hardness), 2)
-                else:
-                    self.set_value(self.output_hardness, 60, command_json[self.output_hardness.name], 8)
-            elif self.regeneration_start.name in command_json:
-                    self.start_regeneration()
-
-
-            if self.USE_WITH_SOFTWELL_P == False:
-                if self.salt_stock.name in command_json:
-                    self.set_value(self.salt_stock, 94,command_json[self.salt_stock.name]*1000, 16)
-                
-                elif self.water_lock.name in command_json:
-                    self.set_water_lock(command_json[self.water_lock.name])
-
-
-                elif self.sleepmode.name in command_json:
-                    self.set_sleepmode(command_json[self.sleepmode.name])
-
-                elif self.max_waterflow.name in command_json:
-                    self.set_value(self.max_waterflow, 75, command_json[self.max_waterflow.name], 16)
-
-                elif self.extraction_time.name in command_json:
-                    self.set_value(self.extraction_time, 74, command_json[self.extraction_time.name], 16)
-
-                elif self.extraction_quantity.name in command_json:
-                    self.set_value(self.extraction_quantity, 76, command_json[self.extraction_quantity.name], 16)
-
-                elif self.holidaymode.name in command_json:
-                    self.set_holidaymode(command_json[self.holidaymode.name])
+            command_json = judo_json.loads(message.payload)
+            # a payload may contain several settings, all of them are queued and sent in one batch
+            for name, value in command_json.items():
+                command = self._command_handlers.get(name)
+                if command is None:
+                    self.log.warning(messages_getjudo.debug[6])
+                    continue
+                key, handler = command
+                self._commands.put(key, handler, value)
 
         except Exception as e:
             self.notify.publish([messages_getjudo.debug[27].format(sys.exc_info()[-1].tb_lineno),e], 3)
 
+    def on_command_error(self, e):
+        # called by the command queue with exceptions raised while sending a command
+        self.notify.publish([messages_getjudo.debug[27].format(traceback.extract_tb(e.__traceback__)[-1].lineno),e], 3)
+
+    def set_output_hardness(self, hardness):
+        if self.USE_SODIUM_CHECK == True:
+            sodium = round(((self.input_hardness.value - hardness) * 8.2) + self.SODIUM_INPUT,1)
+            if  sodium < self.SODIUM_LIMIT:
+                if self.send_command(str(60), self.int_to_le_hex(hardness, 8)):
+                    self.notify.publish(messages_getjudo.debug[43].format(sodium, self.SODIUM_LIMIT, hardness), 2)
+                    self.set_optimistic(self.output_hardness, hardness)
+            else:
+                limited_hardness = self.input_hardness.value - ((self.SODIUM_LIMIT - self.SODIUM_INPUT)/8.2)
+                limited_hardness = math.ceil(limited_hardness) #round up
+                if self.send_command(str(60), self.int_to_le_hex(limited_hardness, 8)):
+                    self.notify.publish(messages_getjudo.debug[44].format(limited_hardness), 2)
+                    self.set_optimistic(self.output_hardness, limited_hardness)
+        else:
+            self.set_value(self.output_hardness, 60, hardness, 8)
+
     def set_water_lock(self, pos):
         if pos < 2:
             pos_index = str(73 - pos)
             if self.send_command(pos_index, ""):
                 self.notify.publish(messages_getjudo.debug[7].format(pos), 2)
+                self.set_optimistic(self.water_lock, pos)
         else:
-            print(messages_getjudo.debug[9])
+            self.log.warning(messages_getjudo.debug[9])
 
 
     def set_sleepmode(self, hours):
         if hours == 0:
             if self.send_command("73", ""):
                 self.notify.publish(messages_getjudo.debug[10], 2)
+                self.set_optimistic(self.sleepmode, 0)
         else:
             if self.send_command("171", str(hours)):
                 self.notify.publish(messages_getjudo.debug[12].format(hours), 2)
             if self.send_command("171", ""):
                 self.notify.publish(messages_getjudo.debug[14], 2)
+                self.set_optimistic(self.sleepmode, hours)
 
 
     def set_holidaymode(self, mode):
         if mode == messages_getjudo.holiday_options[1]:      #lock
-            self.send_command("77", "9")
+            success = self.send_command("77", "9")
         elif mode == messages_getjudo.holiday_options[2]:    #mode1
-            self.send_command("77", "3")
+            success = self.send_command("77", "3")
         elif mode == messages_getjudo.holiday_options[3]:    #mode2
-            self.send_command("77", "5")
+            success = self.send_command("77", "5")
         else:                                               #off
+            mode = messages_getjudo.holiday_options[0]
             if self.send_command("73", ""):
                 self.notify.publish(messages_getjudo.debug[40], 1)
-            self.send_command("77", "0")
+            success = self.send_command("77", "0")
+        if success:
+            self.set_optimistic(self.holidaymode, mode)
 
 
     def start_regeneration(self):
         if self.send_command("65", ""):
             self.notify.publish(messages_getjudo.debug[16], 2)
+            self.set_optimistic(self.regeneration_start, 1)
 
 
-    def set_value(self, obj, index, value, length):
+    def set_value(self, obj, index, value, length, state=None):
+        # state is the value of the entity after the command, if it differs from the written value
         if self.send_command(str(index), self.int_to_le_hex(value, length)):
             self.notify.publish(messages_getjudo.debug[18].format(obj.name, value), 2)
+            self.set_optimistic(obj, value if state is None else state)
+
+    def set_optimistic(self, entity, value):
+        # show the commanded value right away, the confirmation poll confirms or reverts it
+        with self._publish_lock:
+            entity.value = value
+            self._expected[entity.name] = (entity, value, time.monotonic() + self.CONFIRMATION_TIMEOUT)
+            # the value may be in a slow register, the confirmation poll has to decode it
+            self._slow_cadence.reset()
+        self.publish_entities()
+        if self._scheduler is not None:
+            self._scheduler.request_poll(self.CONFIRMATION_DELAY)
+
+    def reconcile_expected(self):
+        # called after decoding, compares the values reported by the device with the commanded ones
+        for name, (entity, value, deadline) in list(self._expected.items()):
+            if entity.value == value:
+                del self._expected[name]
+            elif time.monotonic() >= deadline:
+                # the device did not take over the value, keep the reported one
+                del self._expected[name]
+                self.notify.publish(messages_getjudo.debug[48].format(name, value, entity.value), 2)
+            else:
+                # the cloud does not report the new value yet, keep showing the commanded one
+                entity.value = value
+                self._slow_cadence.reset()
+                if self._scheduler is not None:
+                    self._scheduler.request_poll(self.CONFIRMATION_DELAY)
 
 
 class Entity():
-    def __init__(self, device: JudoDeviceConfig, name, icon, entity_type, unit = "", minimum = 1, maximum = 100, step = 1, value = 0):
+    # thousands of devices have a few dozen entities each, no __dict__ per instance
+    __slots__ = ("device", "name", "unit", "icon", "entity_type", "value", "minimum", "maximum", "step", "deadband", "_autoconfig", "state_topic")
+
+    def __init__(self, device: JudoDeviceConfig, name, icon, entity_type, unit = "", minimum = 1, maximum = 100, step = 1, value = 0, deadband = 0):
         self.device = device
         self.name = name
         self.unit = unit
@@ -389,21 +501,30 @@ class Entity():
         self.minimum = minimum
         self.maximum = maximum
         self.step = step
-
-    def send_entity_autoconfig(self):
+        self.deadband = deadband    # numeric changes up to this value are not published
+        self._autoconfig = None     # (topic, payload, hash), see autoconfig()
+        self.state_topic = f"{device.state_topic}/{name}"   # only used with STATE_TOPIC_MODE = "entity"
+
+    def autoconfig(self):
+        """Returns (topic, payload, hash) of the discovery config, it is rendered only once."""
+        if self._autoconfig is not None:
+            return self._autoconfig
         entity_config = self.device.entity_config
         entity_config["name"] = self.device.client_id + " " + self.name
         entity_config["unique_id"] = self.device.client_id + "_" + self.name
         entity_config["icon"] = self.icon
-        entity_config["value_template"] = "{{value_json." + self.name + "}}"
-        entity_config["state_topic"] = self.device.state_topic
+        if self.device.STATE_TOPIC_MODE == "entity":
+            entity_config["state_topic"] = self.state_topic
+        else:
+            entity_config["value_template"] = "{{value_json." + self.name + "}}"
+            entity_config["state_topic"] = self.device.state_topic
+        component = self.entity_type
 
         if self.entity_type == "total_increasing":
             entity_config["device_class"] = "water"
             entity_config["state_class"] = "total_increasing"
-            entity_config["state_class"] = self.entity_type
             entity_config["unit_of_measurement"] = self.unit
-            self.entity_type = "sensor"
+            component = "sensor"
 
         elif self.entity_type == "number":
             entity_config["command_topic"] = self.device.command_topic
@@ -423,50 +544,60 @@ class Entity():
         elif self.entity_type == "sensor":
             entity_config["unit_of_measurement"] = self.unit
 
+        elif self.entity_type == "diagnostic":
+            entity_config["entity_category"] = "diagnostic"
+            component = "sensor"
+
         elif self.entity_type == "select":
             entity_config["command_topic"] = self.device.command_topic
             entity_config["command_template"] = "{\"" + self.name + "\": \"{{ value }}\"}"
             entity_config["options"] = self.unit
 
         else:
-            print(messages_getjudo.debug[26])
-            return
-
-        autoconf_topic = discovery_topic(self.entity_type, self.device.LOCATION, self.device.NAME + "_" + self.name)
-        publish_json(self.device._client, autoconf_topic, entity_config)
+            self.device.log.warning(messages_getjudo.debug[26])
+            return None
 
-    def parse(self, response_data, index, a,b):
-        val = response_data["data"][0]["data"][str(index)]["data"]
-        if val != "":
-            self.value = int.from_bytes(bytes.fromhex(val[a:b]), byteorder='little')
+        self._autoconfig = render_autoconfig(component, self.device.LOCATION, self.device.NAME + "_" + self.name, entity_config)
+        return self._autoconfig
 
 class NotificationEntity():
+    __slots__ = ("device", "name", "icon", "value", "counter", "_autoconfig")
+
     def __init__(self, device: JudoDeviceConfig, name, icon, counter=0, value = ""):
         self.device = device
         self.name = name
         self.icon = icon
         self.value = value
         self.counter = counter
-
-    def send_autoconfig(self):
-        entity_config = self.device.entity_config
-        entity_config["name"] = self.device.client_id + " " + self.name
-        entity_config["unique_id"] = self.device.client_id + "_" + self.name
-        entity_config["icon"] = self.icon
-        entity_config["state_topic"] = self.device.notification_topic
-        autoconf_topic = discovery_topic("sensor", self.device.LOCATION, self.device.NAME + "_" + self.name)
-        publish_json(self.device._client, autoconf_topic, entity_config)
+        self._autoconfig = None
+
+    def autoconfig(self):
+        """Returns (topic, payload, hash) of the discovery config, it is rendered only once."""
+        if self._autoconfig is None:
+            entity_config = self.device.entity_config
+            entity_config["name"] = self.device.client_id + " " + self.name
+            entity_config["unique_id"] = self.device.client_id + "_" + self.name
+            entity_config["icon"] = self.icon
+            entity_config["state_topic"] = self.device.notification_topic
+            # only the bridge availability, the notification reports the outages of myjudo.eu
+            entity_config["availability"] = entity_config["availability"][:1]
+            del entity_config["availability_mode"]
+            self._autoconfig = render_autoconfig("sensor", self.device.LOCATION, self.device.NAME + "_" + self.name, entity_config)
+        return self._autoconfig
 
     def publish(self, message, debuglevel):
         self.value = message
-        msg = str(self.value)
-        print(f"{time.strftime('%Y-%m-%d %H:%M %Z', time.localtime(time.time()))} - {msg}")
+        msg = redact(str(self.value))
+        self.device.log.log(NOTIFY_LEVELS.get(debuglevel, logging.INFO), msg)
         if self.device.MQTT_DEBUG_LEVEL  >= debuglevel:
             self.device._client.publish(self.device.notification_topic, msg, qos=0, retain=True)
 
 def publish_json(client, topic, message):
-    json_message = json.dumps(message)
-    result = client.publish(topic, json_message, qos=0, retain=True)
+    result = client.publish(topic, judo_json.dumps(message), qos=0, retain=True)
+
+def render_autoconfig(component, node_id, object_id, config):
+    payload = judo_json.dumps(config)
+    return discovery_topic(component, node_id, object_id), payload, hashlib.sha1(payload).hexdigest()
 
 def discovery_topic(entity_type, node_id, object_id, discovery_prefix="homeassistant"):
     # https://www.home-assistant.io/integrations/mqtt/#discovery-topic
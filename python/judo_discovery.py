@@ -0,0 +1,61 @@
+import hashlib
+import logging
+from threading import Lock, Timer
+import messages_getjudo
+from judo_logging import LOGGER_NAME
+
+
+class DiscoveryPublisher():
+    """Publishes the Home Assistant discovery configs, but only those not already retained on the broker.
+
+    After connecting, the config topics are subscribed to collect the retained configs. Once the broker
+    had time to send them (settle_time), only the configs whose hash differs are published.
+    """
+    def __init__(self, client, devices, settle_time=2, discovery_prefix="homeassistant"):
+        self.client = client
+        self.devices = devices
+        self.settle_time = settle_time
+        self.discovery_prefix = discovery_prefix
+        self.retained = {}  # topic -> hash of the retained config
+        self.collecting = False
+        self.timer = None
+        self.lock = Lock()
+
+    def topic_filters(self):
+        # <discovery_prefix>/<component>/<node_id>/<object_id>/config, node_id is the same for all devices of a location
+        node_ids = {topic.split("/")[2] for device in self.devices for topic, _, _ in device.autoconfigs()}
+        return [f"{self.discovery_prefix}/+/{node_id}/+/config" for node_id in sorted(node_ids)]
+
+    def handles(self, topic):
+        return self.collecting and topic.startswith(self.discovery_prefix + "/") and topic.endswith("/config")
+
+    def on_connect(self):
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+            self.retained = {}
+            self.collecting = True
+            for topic_filter in self.topic_filters():
+                self.client.subscribe(topic_filter)
+            self.timer = Timer(self.settle_time, self.publish_changed)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def on_message(self, message):
+        with self.lock:
+            self.retained[message.topic] = hashlib.sha1(message.payload).hexdigest()
+
+    def publish_changed(self):
+        with self.lock:
+            self.collecting = False
+            for topic_filter in self.topic_filters():
+                self.client.unsubscribe(topic_filter)
+            sent = total = 0
+            for device in self.devices:
+                for topic, payload, digest in device.autoconfigs():
+                    total += 1
+                    if self.retained.get(topic) != digest:
+                        self.client.publish(topic, payload, qos=0, retain=True)
+                        self.retained[topic] = digest
+                        sent += 1
+        logging.getLogger(LOGGER_NAME).info(messages_getjudo.debug[3].format(sent, total))
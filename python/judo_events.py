@@ -0,0 +1,84 @@
+import logging
+import messages_getjudo
+from judo_logging import LOGGER_NAME
+from judo_scheduler import Cadence
+
+SEEN_IDS = 200      # non-numeric ids remembered per device, more than the history returns at once
+
+log = logging.getLogger(f"{LOGGER_NAME}.events")
+
+
+def event_id(entry):
+    """Returns the id of the entry as number, None if it is no number."""
+    try:
+        return int(entry["id"])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def event_text(entry):
+    """Notification text of an entry of the error history, with a fallback for unknown codes."""
+    timestamp = entry.get("ts_sort", "")[:-7]
+    if entry.get("type") == "w":
+        text = messages_getjudo.warnings.get(entry.get("error")) or messages_getjudo.debug[54].format(entry.get("error"))
+    else:
+        text = messages_getjudo.errors.get(entry.get("error")) or messages_getjudo.debug[55].format(entry.get("error"))
+    return f"{timestamp}: {text}" if timestamp else text
+
+
+class ErrorHistory():
+    """Finds the new entries in the error history of a myjudo.eu account.
+
+    The history contains the warnings and errors of all devices of the account, newest first.
+    Each device keeps the id of the newest entry it has seen (save_data.last_err_id); all entries
+    above it are new and returned oldest first. Ids that are no numbers can't be compared, the device
+    remembers the last SEEN_IDS of them instead (save_data.seen_err_ids).
+    A device without a mark only gets its newest entry, older ones are marked as seen so a new
+    installation is not flooded with the whole history.
+    The history changes rarely, it is fetched at most every `interval` seconds.
+    """
+    def __init__(self, interval=0):
+        self.cadence = Cadence(interval)
+        self.warned = False     # non-numeric ids are logged once
+
+    def due(self):
+        """Returns True if the history should be fetched in this poll cycle."""
+        return self.cadence.due()
+
+    def new_events(self, registry, entries):
+        """Returns [(device, entry)] of the entries not seen before, oldest first, and advances the marks."""
+        by_serial = {}
+        seen = set()
+        # the history is newest first, the position orders the entries whatever their ids are
+        for position, entry in enumerate(entries):
+            device = registry.by_serial.get(entry.get("serialnumber"))
+            if device is None:
+                continue
+            key = event_id(entry)
+            if key is None:
+                key = str(entry.get("id"))
+                if not self.warned:
+                    log.warning("Entry id %r of the error history is no number, falling back to the ids seen before", key)
+                    self.warned = True
+                if key in seen or key in device.save_data.seen_err_ids:
+                    continue
+            elif key in seen or key <= device.save_data.last_err_id:
+                continue
+            seen.add(key)
+            by_serial.setdefault(device.SERIAL_NUMBER, (device, []))[1].append((position, key, entry))
+
+        events = []
+        for device, device_entries in by_serial.values():
+            device_entries.sort(key=lambda item: -item[0])
+            new_device = not device.save_data.last_err_id and not device.save_data.seen_err_ids
+            numbers = [key for _, key, _ in device_entries if isinstance(key, int)]
+            if numbers:
+                device.save_data.last_err_id = max(numbers)
+            other_ids = [key for _, key, _ in device_entries if isinstance(key, str)]
+            if other_ids:
+                device.save_data.seen_err_ids = (list(device.save_data.seen_err_ids) + other_ids)[-SEEN_IDS:]
+            if new_device:
+                device_entries = device_entries[-1:]
+            events += ((position, device, entry) for position, _, entry in device_entries)
+        events.sort(key=lambda event: -event[0])
+        return [(device, entry) for position, device, entry in events]
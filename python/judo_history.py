@@ -0,0 +1,302 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+import argparse
+import json
+import logging
+import os
+import struct
+import sys
+import time
+import zlib
+from array import array
+from datetime import datetime
+from judo_logging import LOGGER_NAME
+
+# name, bucket width in seconds (0 = every sample), default capacity
+TIERS = [
+    ("raw", 0, 1080),           # 6h at a poll interval of 20s
+    ("minute", 60, 1440),       # 1 day
+    ("hour", 3600, 2160),       # 90 days
+    ("day", 86400, 1825),       # 5 years
+]
+
+_MAGIC = b"JUDOHIST2\n"
+
+# File layout: magic, layout line (JSON: entities and ring capacities, size of a state slot), two state slots
+# and the records of all rings in the order of the layout (timestamps, then values of each ring).
+# The layout only changes if an entity is added, then the file is rewritten completely. Otherwise a save
+# writes the new records in place and then the state (ring positions, open buckets) into the older of the
+# two slots, each slot carries a generation and a checksum: an interrupted save leaves the previous state valid
+# (at most the oldest records of a full ring are replaced by the new ones).
+_SLOT = struct.Struct("<QII")   # generation, crc32 and length of the state JSON
+
+log = logging.getLogger(f"{LOGGER_NAME}.history")
+
+
+class RingBuffer():
+    """Fixed size ring buffer of (timestamp, value) records, backed by two arrays."""
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.times = array("I", bytes(4 * capacity))    # unix timestamp
+        self.values = array("d", bytes(8 * capacity))
+        self.head = 0       # next position to write
+        self.count = 0
+        self.unsaved = 0    # records appended since the last save
+
+    def append(self, timestamp, value):
+        self.times[self.head] = int(timestamp)
+        self.values[self.head] = value
+        self.head = (self.head + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+        self.unsaved = min(self.unsaved + 1, self.capacity)
+
+    def unsaved_ranges(self):
+        # (start, end) positions of the records appended since the last save, at most two because of the wrap-around
+        if not self.unsaved:
+            return []
+        start = (self.head - self.unsaved) % self.capacity
+        if start < self.head:
+            return [(start, self.head)]
+        return [(start, self.capacity), (0, self.head)]
+
+    def __iter__(self):
+        start = (self.head - self.count) % self.capacity
+        for i in range(self.count):
+            pos = (start + i) % self.capacity
+            yield self.times[pos], self.values[pos]
+
+
+class Series():
+    """All tiers of one value. The aggregated tiers store the mean of each bucket."""
+    def __init__(self, capacities=None):
+        capacities = capacities or {}
+        self.tiers = {name: RingBuffer(capacities.get(name, capacity)) for name, _, capacity in TIERS}
+        self.buckets = {name: [0, 0.0, 0] for name, width, _ in TIERS if width}  # start, sum, count of the open bucket
+
+    def record(self, timestamp, value):
+        self.tiers["raw"].append(timestamp, value)
+        for name, width, _ in TIERS:
+            if not width:
+                continue
+            bucket = self.buckets[name]
+            start = int(timestamp // width * width)
+            if bucket[2] and bucket[0] != start:
+                # bucket complete
+                self.tiers[name].append(bucket[0], bucket[1] / bucket[2])
+                bucket[1] = 0.0
+                bucket[2] = 0
+            bucket[0] = start
+            bucket[1] += value
+            bucket[2] += 1
+
+    def query(self, tier, start=0, end=None):
+        end = end if end is not None else float("inf")
+        return [(t, v) for t, v in self.tiers[tier] if start <= t <= end]
+
+
+class DeviceHistory():
+    """Time series of all numeric entity values of one device, except the diagnostic ones (versions, device number)."""
+    def __init__(self, capacities=None):
+        self.capacities = capacities
+        self.series: dict[str, Series] = {}
+        self._file_layout = None    # layout of the file written or loaded last, None = no file yet
+        self._slot_size = 0
+        self._data_offset = 0
+        self._generation = 0
+
+    def record(self, entities, timestamp=None):
+        timestamp = timestamp if timestamp is not None else time.time()
+        for entity in entities:
+            value = entity.value
+            if isinstance(value, bool) or not isinstance(value, (int, float)) or entity.entity_type == "diagnostic":
+                continue
+            series = self.series.get(entity.name)
+            if series is None:
+                series = self.series[entity.name] = Series(self.capacities)
+            series.record(timestamp, value)
+
+    def layout(self):
+        return {name: {tier: buf.capacity for tier, buf in series.tiers.items()} for name, series in self.series.items()}
+
+    def state(self):
+        return {
+            "tiers": {name: {tier: [buf.head, buf.count] for tier, buf in series.tiers.items()} for name, series in self.series.items()},
+            "buckets": {name: series.buckets for name, series in self.series.items()},
+        }
+
+    def save(self, path):
+        """Writes the records appended since the last save and the new state in place, or the complete file if needed."""
+        state = json.dumps(self.state()).encode("utf-8")
+        if self._file_layout != self.layout() or _SLOT.size + len(state) > self._slot_size or not os.path.exists(path):
+            self._save_all(path, state)
+        else:
+            self._save_changes(path, state)
+        for series in self.series.values():
+            for buf in series.tiers.values():
+                buf.unsaved = 0
+
+    def _save_all(self, path, state):
+        # written to a temporary file first, so a crash never leaves a corrupt history
+        layout = self.layout()
+        self._slot_size = 2 * len(state) + 1024   # room for the growing numbers of the state
+        layout_line = json.dumps({"series": layout, "slot_size": self._slot_size}).encode("utf-8") + b"\n"
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(_MAGIC)
+            f.write(layout_line)
+            f.write(self._slot(state, 1).ljust(self._slot_size, b"\0"))
+            f.write(bytes(self._slot_size))     # second slot, empty until the next save
+            for series in self.series.values():
+                for buf in series.tiers.values():
+                    buf.times.tofile(f)
+                    buf.values.tofile(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        self._generation = 1
+        self._file_layout = layout
+        self._data_offset = len(_MAGIC) + len(layout_line) + 2 * self._slot_size
+
+    def _save_changes(self, path, state):
+        with open(path, "r+b") as f:
+            offset = self._data_offset
+            for series in self.series.values():
+                for buf in series.tiers.values():
+                    for start, end in buf.unsaved_ranges():
+                        f.seek(offset + start * buf.times.itemsize)
+                        f.write(buf.times[start:end].tobytes())
+                        f.seek(offset + buf.capacity * buf.times.itemsize + start * buf.values.itemsize)
+                        f.write(buf.values[start:end].tobytes())
+                    offset += buf.capacity * (buf.times.itemsize + buf.values.itemsize)
+            # the records must be on disk before the state referring to them
+            f.flush()
+            os.fsync(f.fileno())
+            generation = self._generation + 1
+            # alternating slots: the first slot holds the odd generations, the second one the even ones
+            f.seek(self._data_offset - 2 * self._slot_size + (generation - 1) % 2 * self._slot_size)
+            f.write(self._slot(state, generation))
+            f.flush()
+            os.fsync(f.fileno())
+            self._generation = generation
+
+    def _slot(self, state, generation):
+        # the rest of the slot is not written, the length tells where the state ends
+        return _SLOT.pack(generation, zlib.crc32(state), len(state)) + state
+
+    @classmethod
+    def load(cls, path, capacities=None):
+        history = cls(capacities)
+        with open(path, "rb") as f:
+            if f.readline() != _MAGIC:
+                raise ValueError(f"{path} is no history file")
+            layout_line = f.readline()
+            info = json.loads(layout_line)
+            history._slot_size = info["slot_size"]
+            slots = [cls._read_slot(f.read(history._slot_size)) for _ in range(2)]
+            slots = [slot for slot in slots if slot is not None]
+            if not slots:
+                raise ValueError(f"{path} has no valid state")
+            history._generation, state = max(slots, key=lambda slot: slot[0])
+            for name, tiers in info["series"].items():
+                series = Series()
+                for tier, capacity in tiers.items():
+                    buf = RingBuffer(capacity)
+                    buf.times = array("I")
+                    buf.times.fromfile(f, capacity)
+                    buf.values = array("d")
+                    buf.values.fromfile(f, capacity)
+                    buf.head, buf.count = state["tiers"][name][tier]
+                    series.tiers[tier] = buf
+                series.buckets = state["buckets"][name]
+                history.series[name] = series
+        history._file_layout = info["series"]
+        history._data_offset = len(_MAGIC) + len(layout_line) + 2 * history._slot_size
+        return history
+
+    @staticmethod
+    def _read_slot(data):
+        generation, crc, length = _SLOT.unpack_from(data)
+        state = data[_SLOT.size:_SLOT.size + length]
+        if generation == 0 or len(state) != length or zlib.crc32(state) != crc:
+            return None
+        return generation, json.loads(state)
+
+
+class HistoryRecorder():
+    """Records the entity values of all devices and saves them to one file per device in directory."""
+    def __init__(self, directory, save_interval=300, capacities=None):
+        self.directory = directory
+        self.save_interval = save_interval
+        self.capacities = capacities
+        self.histories: dict[str, DeviceHistory] = {}
+        self.dirty = set()      # keys of the histories recorded to since the last save
+        self.last_save = time.monotonic()
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.directory, f"{key}.hist")
+
+    def history(self, device):
+        key = device.SERIAL_NUMBER or device.NAME
+        history = self.histories.get(key)
+        if history is None:
+            path = self.path(key)
+            try:
+                history = DeviceHistory.load(path, self.capacities)
+            except FileNotFoundError:
+                history = DeviceHistory(self.capacities)
+            except Exception as e:
+                # truncated or corrupt, kept aside and replaced by a new history
+                log.warning("Unreadable history %s (%s), starting a new one", path, e)
+                try:
+                    os.replace(path, path + ".corrupt")
+                except OSError:
+                    pass
+                history = DeviceHistory(self.capacities)
+            self.histories[key] = history
+        return history
+
+    def record(self, device):
+        self.history(device).record(device.entities)
+        self.dirty.add(device.SERIAL_NUMBER or device.NAME)
+
+    def save(self, force=False):
+        if not force and time.monotonic() - self.last_save < self.save_interval:
+            return
+        for key in self.dirty:
+            self.histories[key].save(self.path(key))
+        self.dirty.clear()
+        self.last_save = time.monotonic()
+
+
+def _parse_time(value):
+    return datetime.fromisoformat(value).timestamp()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export the recorded history of a Judo device")
+    parser.add_argument("file", help="history file, e.g. history/<serial number>.hist")
+    parser.add_argument("entity", nargs="?", help="entity name, lists all recorded entities if omitted")
+    parser.add_argument("--tier", default="hour", choices=[name for name, _, _ in TIERS])
+    parser.add_argument("--start", type=_parse_time, default=0, help="ISO date/time, e.g. 2024-01-31T12:00")
+    parser.add_argument("--end", type=_parse_time, default=None, help="ISO date/time")
+    parser.add_argument("--format", default="csv", choices=["csv", "json"])
+    args = parser.parse_args(argv)
+
+    history = DeviceHistory.load(args.file)
+    if args.entity is None:
+        for name in history.series:
+            print(name)
+        return
+    rows = history.series[args.entity].query(args.tier, args.start, args.end)
+    if args.format == "json":
+        json.dump([{"timestamp": t, "value": v} for t, v in rows], sys.stdout)
+        print()
+    else:
+        print("timestamp,value")
+        for t, v in rows:
+            print(f"{datetime.fromtimestamp(t).isoformat()},{v}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+import json
+
+# JSON encoding and decoding of the myjudo.eu responses, MQTT payloads and discovery configs.
+# orjson or ujson are used if installed (pip install orjson), otherwise the json module of the standard library.
+# loads() accepts bytes, dumps() returns compact UTF-8 bytes, the same with every backend.
+
+
+def _orjson():
+    import orjson
+
+    def dumps(obj):
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+    return orjson.loads, dumps
+
+
+def _ujson():
+    import ujson
+
+    def dumps(obj):
+        return ujson.dumps(obj, ensure_ascii=False, escape_forward_slashes=False).encode("utf-8")
+    return ujson.loads, dumps
+
+
+def _stdlib():
+    def dumps(obj):
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return json.loads, dumps
+
+
+BACKENDS = {"orjson": _orjson, "ujson": _ujson, "json": _stdlib}   # in order of preference
+
+
+def backend(name):
+    """Returns (loads, dumps) of the backend, raises ImportError if it is not installed."""
+    return BACKENDS[name]()
+
+
+def available_backends():
+    names = []
+    for name in BACKENDS:
+        try:
+            backend(name)
+        except ImportError:
+            continue
+        names.append(name)
+    return names
+
+
+BACKEND = available_backends()[0]
+loads, dumps = backend(BACKEND)
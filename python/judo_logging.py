@@ -0,0 +1,109 @@
+import atexit
+import logging
+import logging.handlers
+import queue
+import re
+import sys
+import time
+from threading import Lock
+
+LOGGER_NAME = "getjudo"
+
+# debuglevel of a notification (see MQTT_DEBUG_LEVEL) -> log level
+NOTIFY_LEVELS = {1: logging.WARNING, 2: logging.INFO, 3: logging.ERROR}
+
+# MQTT_DEBUG_LEVEL -> log level, if LOG_LEVEL is not set
+DEBUG_LEVEL_LOG_LEVELS = {0: logging.WARNING, 1: logging.WARNING, 2: logging.INFO, 3: logging.DEBUG}
+
+_secrets = set()
+_url_secrets = re.compile(r"\b((?:token|password)=)[^&\s'\"]+")
+_listener = None
+
+
+def add_secret(secret):
+    """Masks the value (token, password) in all log messages and notifications from now on."""
+    if secret:
+        _secrets.add(str(secret))
+
+
+def redact(text):
+    for secret in _secrets:
+        text = text.replace(secret, "***")
+    return _url_secrets.sub(r"\1***", text)
+
+
+class RedactingFormatter(logging.Formatter):
+    def format(self, record):
+        return redact(super().format(record))
+
+
+class RateLimitFilter(logging.Filter):
+    """Drops repetitions of the same warning or error within `interval` seconds.
+
+    The number of dropped repetitions is appended to the next message passing the filter.
+    """
+    def __init__(self, interval, level=logging.WARNING, max_keys=1000):
+        super().__init__()
+        self.interval = interval
+        self.level = level
+        self.max_keys = max_keys
+        self.seen = {}  # (logger, level, message) -> [time of the last passed message, dropped since]
+        self.lock = Lock()
+
+    def filter(self, record):
+        if not self.interval or record.levelno < self.level:
+            return True
+        message = record.getMessage()
+        key = (record.name, record.levelno, message)
+        now = time.monotonic()
+        with self.lock:
+            entry = self.seen.get(key)
+            if entry is not None and now - entry[0] < self.interval:
+                entry[1] += 1
+                return False
+            if entry is not None and entry[1]:
+                record.msg = f"{message} ({entry[1]}x suppressed)"
+                record.args = None
+            self.seen[key] = [now, 0]
+            if len(self.seen) > self.max_keys:
+                self.seen = {k: v for k, v in self.seen.items() if now - v[0] < self.interval}
+        return True
+
+
+def log_level(level_name, debug_level):
+    if level_name:
+        return logging.getLevelName(level_name.upper())
+    return DEBUG_LEVEL_LOG_LEVELS.get(debug_level, logging.DEBUG)
+
+
+def setup_logging(level=logging.INFO, log_file="", rate_limit=300):
+    """Sends the records of the "getjudo" loggers through a queue to a background thread writing them.
+
+    Logging never blocks on stdout or file I/O this way. Calling it again replaces the previous setup.
+    """
+    global _listener
+    logger = logging.getLogger(LOGGER_NAME)
+    if _listener is not None:
+        _listener.stop()
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+
+    formatter = RedactingFormatter("%(asctime)s %(levelname)-7s %(name)s: %(message)s", "%Y-%m-%d %H:%M:%S")
+    handlers = [logging.StreamHandler(sys.stdout)]
+    if log_file != "":
+        handlers.append(logging.handlers.RotatingFileHandler(log_file, maxBytes=1024 * 1024, backupCount=3, encoding="utf-8"))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.addFilter(RateLimitFilter(rate_limit))
+    logger.addHandler(queue_handler)
+    logger.setLevel(level)
+    # AppDaemon and others may have handlers on the root logger, do not log twice
+    logger.propagate = False
+
+    _listener = logging.handlers.QueueListener(log_queue, *handlers)
+    _listener.start()
+    atexit.register(_listener.stop)
+    return logger
@@ -0,0 +1,157 @@
+from bisect import bisect_left
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from threading import Lock, Thread
+
+# seconds, the myjudo.eu requests usually take 0.2 - 2 s
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# name -> (type, help)
+FAMILIES = {
+    "judo_poll_duration_seconds": ("histogram", "Duration of a poll cycle"),
+    "judo_poll_errors": ("gauge", "Errors of the last poll cycle"),
+    "judo_poll_errors_total": ("counter", "Errors of all poll cycles"),
+    "judo_http_request_duration_seconds": ("histogram", "Latency of the myjudo.eu requests by endpoint"),
+    "judo_http_request_errors_total": ("counter", "Failed myjudo.eu requests by endpoint"),
+    "judo_circuit_state": ("gauge", "Circuit breaker of an account: 0 = closed, 0.5 = half open, 1 = open"),
+    "judo_relogins_total": ("counter", "Logins after the token was rejected"),
+    "judo_mqtt_publishes_total": ("counter", "MQTT messages sent"),
+    "judo_state_publishes_total": ("counter", "State publishes by device"),
+    "judo_state_publishes_suppressed_total": ("counter", "State publishes skipped because nothing changed, by device"),
+    "judo_command_queue_depth": ("gauge", "Commands waiting to be sent, by device"),
+    "judo_commands_sent_total": ("counter", "Commands sent, by device"),
+    "judo_commands_coalesced_total": ("counter", "Commands replaced by a newer one, by device"),
+    "judo_stage_duration_seconds": ("summary", "Duration of the stages of the poll cycle and of commands, over the last calls"),
+    "judo_device_info": ("gauge", "Software and hardware version and device number of a device, always 1"),
+    "judo_entity_value": ("gauge", "Current value of a numeric entity"),
+    "judo_entity_total": ("counter", "Current value of a total_increasing entity"),
+}
+
+
+class Histogram():
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics():
+    """Counters, gauges and histograms of the bridge, rendered in the Prometheus text format.
+
+    Values which already exist elsewhere (entity values, publish and command counters) are not
+    duplicated but read from the devices by the collectors at scrape time.
+    """
+    def __init__(self, collectors=()):
+        self.values = {}    # (name, labels) -> value or Histogram
+        self.collectors = list(collectors)  # functions yielding (name, labels, value)
+        self.lock = Lock()
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        with self.lock:
+            self.values[(name, tuple(sorted(labels.items())))] = value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.values.get(key)
+            if histogram is None:
+                histogram = self.values[key] = Histogram()
+            histogram.observe(value)
+
+    def samples(self):
+        with self.lock:
+            for (name, labels), value in self.values.items():
+                if isinstance(value, Histogram):
+                    cumulative = 0
+                    for le, count in zip(value.buckets + ("+Inf",), value.counts):
+                        cumulative += count
+                        yield name, name + "_bucket", labels + (("le", str(le)),), cumulative
+                    yield name, name + "_sum", labels, value.sum
+                    yield name, name + "_count", labels, value.count
+                else:
+                    yield name, name, labels, value
+        for collector in self.collectors:
+            for name, labels, value in collector():
+                yield name, name, tuple(sorted(labels.items())), value
+
+    def render(self):
+        families = {}
+        for family, name, labels, value in self.samples():
+            families.setdefault(family, []).append(f"{name}{format_labels(labels)} {float(value)!r}")
+        lines = []
+        for family, samples in families.items():
+            metric_type, description = FAMILIES[family]
+            lines.append(f"# HELP {family} {description}")
+            lines.append(f"# TYPE {family} {metric_type}")
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n") for _, value in labels)
+    return "{" + ",".join(f"{key}=\"{value}\"" for (key, _), value in zip(labels, escaped)) + "}"
+
+
+def device_collector(devices):
+    """Returns a collector for the entity values and counters of the devices."""
+    def collect():
+        for device in devices:
+            for entity in device.entities:
+                value = entity.value
+                if isinstance(value, bool) or not isinstance(value, (int, float)) or entity.entity_type == "diagnostic":
+                    continue
+                name = "judo_entity_total" if entity.entity_type == "total_increasing" else "judo_entity_value"
+                unit = entity.unit if isinstance(entity.unit, str) else ""
+                yield name, {"device": device.client_id, "entity": entity.name, "unit": unit}, value
+            labels = {"device": device.client_id}
+            if hasattr(device, "software_version"):
+                yield "judo_device_info", {**labels, "software_version": device.software_version.value,
+                    "hardware_version": device.hardware_version.value, "device_number": str(device.device_number.value)}, 1
+            if hasattr(device, "_changes"):
+                yield "judo_state_publishes_total", labels, device._changes.sent
+                yield "judo_state_publishes_suppressed_total", labels, device._changes.suppressed
+            if hasattr(device, "_commands"):
+                yield "judo_command_queue_depth", labels, len(device._commands)
+                yield "judo_commands_sent_total", labels, device._commands.sent
+                yield "judo_commands_coalesced_total", labels, device._commands.coalesced
+    return collect
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    metrics: Metrics = None
+
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = self.metrics.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(metrics, port, host=""):
+    """Serves the metrics on http://<host>:<port>/metrics from a daemon thread."""
+    handler = type("Handler", (MetricsRequestHandler,), {"metrics": metrics})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
+
@@ -0,0 +1,292 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""Offline stand-in for the myjudo.eu interface, for tests and benchmarks without network.
+
+Speaks the same query string protocol as https://www.myjudo.eu/interface/ and simulates any number
+of i-soft save+ devices behind one account. Start it and set JUDO_BASE_URL in config_getjudo.py:
+
+    python3 judo_mock_server.py --devices 100 --latency 0.2 --error-rate 0.01
+    JUDO_BASE_URL = "http://localhost:8080/interface/"
+"""
+import argparse
+import json
+import random
+import secrets
+import struct
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from threading import Lock
+from urllib.parse import urlsplit, parse_qs
+from judo_registers import COMMON_REGISTERS, SAFEPLUS_REGISTERS
+
+# size of the register blocks in bytes
+REGISTER_SIZES = {1: 4, 2: 4, 3: 4, 7: 4, 8: 4, 9: 4, 93: 4, 94: 4, 790: 32, 791: 34, 792: 22}
+
+_FORMATS = {1: "<B", 2: "<H", 4: "<I"}
+
+
+class MockDevice():
+    """Simulated i-soft save+, keeps the raw (undecoded) register values."""
+    def __init__(self, serialnumber, seed=None):
+        self.serialnumber = serialnumber
+        self.random = random.Random(seed)
+        self.lock = Lock()
+        self.last_update = time.monotonic()
+        self.software_version = (2, 14)
+        self.hardware_version = (1, 3)
+        self.sleep_hours = 1    # set by write index 171 with data, activated by index 171 without data
+        self.raw = {
+            "next_revision": 24 * 180,      # hours
+            "total_water": self.random.randrange(10000, 500000),   # L
+            "total_softwater_proportion": 0,
+            "salt_stock": 25000,            # g
+            "salt_range": 120,              # days
+            "batt_capacity": 90,            # %
+            "water_flow": 0,                # L/h
+            "output_hardness": 8,
+            "input_hardness": 20,
+            "regenerations": self.random.randrange(100, 2000),
+            "regeneration_start": 0,
+            "water_lock": 0,
+            "sleepmode": 0,
+            "max_waterflow": 2000,
+            "extraction_quantity": 300,
+            "extraction_time": 30,
+            "holidaymode": 0,
+        }
+        self.raw["total_softwater_proportion"] = int(self.raw["total_water"] * 0.6)
+        self.fields = COMMON_REGISTERS + SAFEPLUS_REGISTERS
+
+    def simulate(self, speed=1):
+        # advances the simulation to now, speed > 1 lets the water flow faster than real time
+        now = time.monotonic()
+        hours = (now - self.last_update) * speed / 3600
+        self.last_update = now
+        raw = self.raw
+        if raw["water_lock"]:
+            raw["water_flow"] = 0
+        elif self.random.random() < 0.3:
+            raw["water_flow"] = self.random.choice([0, 0, 0, 300, 600, 1200])
+        liters = int(raw["water_flow"] * hours)
+        raw["total_water"] += liters
+        raw["total_softwater_proportion"] += int(liters * 0.6)
+        raw["regeneration_start"] = 0
+        if self.random.random() < 0.001:
+            raw["regenerations"] += 1
+            raw["regeneration_start"] = 1
+
+    def registers(self):
+        blocks = {index: bytearray(size) for index, size in REGISTER_SIZES.items()}
+        blocks[1][1:3] = bytes([self.software_version[1], self.software_version[0]])
+        blocks[2][0:2] = bytes([self.hardware_version[1], self.hardware_version[0]])
+        blocks[3][0:4] = struct.pack("<I", int(self.serialnumber) & 0xFFFFFFFF)
+        for f in self.fields:
+            value = self.raw[f.name] & (2 ** (8 * f.size) - 1)
+            struct.pack_into(_FORMATS[f.size], blocks[f.index], f.offset, value)
+        return {str(index): {"data": block.hex()} for index, block in blocks.items()}
+
+    def device_data(self):
+        with self.lock:
+            return {
+                "serialnumber": self.serialnumber,
+                "data": [{"da": "1", "dt": "0x33", "data": self.registers()}],
+            }
+
+    def write(self, index, data):
+        # applies a "write data" command, returns False for unknown indexes
+        with self.lock:
+            raw = self.raw
+            value = int.from_bytes(bytes.fromhex(data), byteorder="little") if data else 0
+            if index == 60:
+                raw["output_hardness"] = value
+            elif index == 65:
+                raw["regenerations"] += 1
+                raw["regeneration_start"] = 1
+            elif index in (72, 73):
+                raw["water_lock"] = 1 if index == 72 else 0
+                if index == 73:
+                    raw["sleepmode"] = 0
+            elif index == 74:
+                raw["extraction_time"] = value
+            elif index == 75:
+                raw["max_waterflow"] = value
+            elif index == 76:
+                raw["extraction_quantity"] = value
+            elif index == 77:
+                raw["holidaymode"] = int(data or 0)
+            elif index == 94:
+                raw["salt_stock"] = value
+            elif index == 171:
+                if data:
+                    self.sleep_hours = int(data)
+                else:
+                    raw["sleepmode"] = self.sleep_hours
+            else:
+                return False
+            return True
+
+
+class MockAccount():
+    """All state of the simulated myjudo.eu account."""
+    def __init__(self, devices=1, user=None, password_md5=None, login_fails=False, token_lifetime=0,
+                 latency=0.0, jitter=0.0, error_rate=0.0, speed=1, warning_interval=0, seed=None, first_serial=100000):
+        self.devices = [MockDevice(str(first_serial + i), None if seed is None else seed + i) for i in range(devices)]
+        self.by_serial = {device.serialnumber: device for device in self.devices}
+        self.user = user
+        self.password_md5 = password_md5
+        self.login_fails = login_fails
+        self.token_lifetime = token_lifetime
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.speed = speed
+        self.warning_interval = warning_interval
+        self.random = random.Random(seed)
+        self.tokens = {}    # token -> time of login
+        self.messages = []
+        self.next_message_id = 1
+        self.last_warning = time.monotonic()
+        self.lock = Lock()
+
+    def login(self, params):
+        if self.login_fails or (self.user is not None and params.get("user") != self.user) \
+                or (self.password_md5 is not None and params.get("password") != self.password_md5):
+            return {"status": "error", "data": "login failed"}
+        token = secrets.token_hex(16)
+        with self.lock:
+            self.tokens[token] = time.monotonic()
+        return {"status": "ok", "token": token}
+
+    def token_valid(self, token):
+        with self.lock:
+            login_time = self.tokens.get(token)
+        if login_time is None:
+            return False
+        return not self.token_lifetime or time.monotonic() - login_time < self.token_lifetime
+
+    def device_data(self):
+        for device in self.devices:
+            device.simulate(self.speed)
+        return {"status": "ok", "data": [device.device_data() for device in self.devices]}
+
+    def error_messages(self):
+        with self.lock:
+            if self.warning_interval and time.monotonic() - self.last_warning >= self.warning_interval:
+                self.last_warning = time.monotonic()
+                device = self.random.choice(self.devices)
+                self.messages.insert(0, {
+                    "id": str(self.next_message_id),
+                    "serialnumber": device.serialnumber,
+                    "type": "w",
+                    "error": self.random.choice([28, 30, 31]),
+                    "ts_sort": time.strftime("%Y-%m-%d %H:%M:%S") + ".000000",
+                })
+                self.next_message_id += 1
+            return {"status": "ok", "count": len(self.messages), "data": list(self.messages)}
+
+    def write_data(self, params):
+        device = self.by_serial.get(params.get("serial_number"))
+        if device is None:
+            return {"status": "error", "data": "unknown device"}
+        if not device.write(int(params.get("index", -1)), params.get("data", "")):
+            return {"status": "error", "data": "invalid index"}
+        return {"status": "ok", "data": ""}
+
+    def handle(self, params):
+        """Returns (HTTP status, response body) for the query parameters of one request."""
+        if self.latency or self.jitter:
+            time.sleep(self.latency + self.random.random() * self.jitter)
+        if self.error_rate and self.random.random() < self.error_rate:
+            return 500, b"Internal Server Error"
+        command = params.get("command")
+        if command == "login":
+            response = self.login(params)
+        elif not self.token_valid(params.get("token")):
+            response = {"status": "error", "data": "login failed"}
+        elif command == "get device data":
+            response = self.device_data()
+        elif command == "get error messages":
+            response = self.error_messages()
+        elif command == "write data":
+            response = self.write_data(params)
+        else:
+            response = {"status": "error", "data": "unknown command"}
+        return 200, json.dumps(response).encode("utf-8")
+
+
+class MockRequestHandler(BaseHTTPRequestHandler):
+    accounts: list[MockAccount] = []
+
+    def account(self, params):
+        # logins are matched by user name, all other requests by token
+        for account in self.accounts:
+            if params.get("command") == "login":
+                if account.user is None or params.get("user") == account.user:
+                    return account
+            elif account.token_valid(params.get("token")):
+                return account
+        return self.accounts[0]
+
+    def do_GET(self):
+        query = parse_qs(urlsplit(self.path).query)
+        params = {key: values[0] for key, values in query.items()}
+        status, body = self.account(params).handle(params)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def serve(accounts, host="localhost", port=8080, verbose=False):
+    """Returns the started (not yet serving) server for one or more accounts, call serve_forever() on it."""
+    if isinstance(accounts, MockAccount):
+        accounts = [accounts]
+    handler = type("Handler", (MockRequestHandler,), {"accounts": list(accounts)})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.verbose = verbose
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline mock of the myjudo.eu interface")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--devices", type=int, default=1, help="number of simulated devices (per account)")
+    parser.add_argument("--accounts", type=int, default=1, help="number of accounts, with more than one the users are user0, user1, ...")
+    parser.add_argument("--user", help="accepted user name, any if omitted")
+    parser.add_argument("--password-md5", help="accepted md5 hash of the password, any if omitted")
+    parser.add_argument("--login-fails", action="store_true", help="reject every login")
+    parser.add_argument("--token-lifetime", type=float, default=0, help="seconds until a token expires, 0 = never")
+    parser.add_argument("--latency", type=float, default=0, help="delay of every response in seconds")
+    parser.add_argument("--jitter", type=float, default=0, help="additional random delay in seconds")
+    parser.add_argument("--error-rate", type=float, default=0, help="fraction of requests answered with HTTP 500")
+    parser.add_argument("--speed", type=float, default=1, help="simulation speed factor of the water consumption")
+    parser.add_argument("--warning-interval", type=float, default=0, help="seconds between simulated warnings, 0 = none")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--verbose", action="store_true", help="log every request")
+    args = parser.parse_args(argv)
+
+    accounts = []
+    for i in range(args.accounts):
+        user = args.user if args.accounts == 1 else f"user{i}"
+        seed = None if args.seed is None else args.seed + 1000 * i
+        accounts.append(MockAccount(args.devices, user, args.password_md5, args.login_fails, args.token_lifetime,
+                                    args.latency, args.jitter, args.error_rate, args.speed, args.warning_interval,
+                                    seed, 100000 + 1000 * i))
+    server = serve(accounts, args.host, args.port, args.verbose)
+    print(f"Simulating {args.accounts} account(s) with {args.devices} device(s) each at http://{args.host}:{args.port}/interface/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+import cProfile
+import io
+import os
+import pstats
+import time
+from collections import deque
+from contextlib import nullcontext
+from threading import Lock
+
+_DISABLED = nullcontext()
+
+
+class Span():
+    def __init__(self, spans, name):
+        self.spans = spans
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.spans.record(self.name, time.perf_counter() - self.start)
+
+
+class Spans():
+    """Durations of the stages of the poll cycle and of commands, the last `window` per stage.
+
+    Disabled, span() returns a shared no-op context manager, so the instrumentation costs next to nothing.
+    """
+    def __init__(self, enabled=False, window=100):
+        self.enabled = enabled
+        self.window = window
+        self.durations = {}     # stage -> deque of the last durations in seconds
+        self.lock = Lock()
+
+    def span(self, name):
+        if not self.enabled:
+            return _DISABLED
+        return Span(self, name)
+
+    def record(self, name, duration):
+        with self.lock:
+            durations = self.durations.get(name)
+            if durations is None:
+                durations = self.durations[name] = deque(maxlen=self.window)
+            durations.append(duration)
+
+    def summary(self):
+        """Returns {stage: {"count", "p50", "p90", "p99", "max"}} over the rolling window."""
+        with self.lock:
+            snapshot = {name: sorted(durations) for name, durations in self.durations.items()}
+        result = {}
+        for name, durations in snapshot.items():
+            result[name] = {"count": len(durations), "max": durations[-1]}
+            for q in (50, 90, 99):
+                result[name][f"p{q}"] = durations[min(len(durations) - 1, int(q / 100 * len(durations)))]
+        return result
+
+    def collect(self):
+        # collector for judo_metrics.Metrics, the rolling window is exported as summary
+        for name, stats in self.summary().items():
+            for q in (50, 90, 99):
+                yield "judo_stage_duration_seconds", {"stage": name, "quantile": str(q / 100)}, stats[f"p{q}"]
+
+    def format(self):
+        lines = [f"{'stage':<24}{'count':>6}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}"]
+        for name, stats in self.summary().items():
+            lines.append(f"{name:<24}{stats['count']:>6}" + "".join(f"{stats[k] * 1000:>10.2f}" for k in ("p50", "p90", "p99", "max")))
+        return "\n".join(lines)
+
+
+class Profiler():
+    """Runs cProfile over the next N poll cycles once started, then writes the stats to `directory`.
+
+    cProfile only sees the thread which runs the cycle (the requests of the asyncio mode run in worker threads).
+    """
+    def __init__(self, directory, spans=None):
+        self.directory = directory
+        self.spans = spans
+        self.remaining = 0
+        self.profile = None
+        self.lock = Lock()
+
+    def start(self, cycles):
+        # may be called from a signal handler or the MQTT thread, the profiling begins with the next cycle
+        with self.lock:
+            self.remaining = max(int(cycles), 1)
+
+    def cycle_start(self):
+        if self.remaining == 0:
+            return
+        with self.lock:
+            if self.profile is None:
+                self.profile = cProfile.Profile()
+        self.profile.enable()
+
+    def cycle_end(self):
+        """Returns the path of the written stats after the last profiled cycle, otherwise None."""
+        if self.profile is None:
+            return None
+        self.profile.disable()
+        with self.lock:
+            self.remaining -= 1
+            if self.remaining > 0:
+                return None
+            profile, self.profile = self.profile, None
+        return self.dump(profile)
+
+    def dump(self, profile):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, time.strftime("profile_%Y%m%d_%H%M%S.pstats"))
+        profile.dump_stats(path)
+        with open(path[:-len(".pstats")] + ".txt", "w") as f:
+            if self.spans is not None and self.spans.enabled:
+                f.write(self.spans.format() + "\n\n")
+            stream = io.StringIO()
+            pstats.Stats(profile, stream=stream).sort_stats("cumulative").print_stats(40)
+            f.write(stream.getvalue())
+        return path
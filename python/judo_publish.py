@@ -0,0 +1,37 @@
+import time
+
+
+class ChangeDetector():
+    """Remembers the last published value of each entity to skip publishes without meaningful changes.
+
+    Numeric values only count as changed if they differ by more than the deadband of the entity
+    from the last published value. Every refresh_interval seconds a full publish is forced.
+    """
+    def __init__(self, refresh_interval):
+        self.refresh_interval = refresh_interval
+        self.last_values = {}
+        self.last_refresh = None
+        self.sent = 0           # number of publishes sent
+        self.suppressed = 0     # number of publishes skipped because nothing changed
+
+    def is_changed(self, entity):
+        if entity.name not in self.last_values:
+            return True
+        last = self.last_values[entity.name]
+        value = entity.value
+        if isinstance(value, (int, float)) and isinstance(last, (int, float)) and not isinstance(value, bool):
+            return abs(value - last) > entity.deadband
+        return value != last
+
+    def refresh_due(self):
+        return self.last_refresh is None or time.monotonic() - self.last_refresh >= self.refresh_interval
+
+    def mark_published(self, entities, full=False):
+        for entity in entities:
+            self.last_values[entity.name] = entity.value
+        if full:
+            self.last_refresh = time.monotonic()
+        self.sent += 1
+
+    def mark_suppressed(self):
+        self.suppressed += 1
@@ -0,0 +1,174 @@
+import struct
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Callable
+import messages_getjudo
+
+
+@dataclass(frozen=True)
+class RegisterField:
+    """A single value inside a register block of the "get device data" response."""
+    name: str       # attribute name of the entity in JudoDeviceConfig
+    index: int      # register index, e.g. 790
+    offset: int     # byte offset inside the register data
+    size: int       # 1, 2 or 4 bytes, little endian
+    transform: Callable | None = None
+
+
+def holidaymode_option(raw):
+    if raw == 3:        #mode1
+        return messages_getjudo.holiday_options[2]
+    elif raw == 5:      #mode2
+        return messages_getjudo.holiday_options[3]
+    elif raw == 9:      #lock
+        return messages_getjudo.holiday_options[1]
+    return messages_getjudo.holiday_options[0]     #off
+
+
+def liters_to_m3(raw):
+    return float(raw/1000)
+
+
+# Registers available on all devices
+COMMON_REGISTERS = [
+    RegisterField("next_revision", 7, 0, 2, lambda raw: int(raw/24)),      #Calculation hours to days
+    RegisterField("output_hardness", 790, 9, 1),
+    RegisterField("input_hardness", 790, 27, 1),
+    RegisterField("regenerations", 791, 31, 2),
+    RegisterField("regeneration_start", 791, 1, 1, lambda raw: 1 if raw & 0x0F else 0),
+]
+
+# Registers of the i-soft save+ (leakage protection, salt and battery sensors)
+SAFEPLUS_REGISTERS = [
+    RegisterField("total_water", 8, 0, 4, liters_to_m3),
+    RegisterField("total_softwater_proportion", 9, 0, 4, liters_to_m3),
+    RegisterField("salt_stock", 94, 0, 2, lambda raw: raw/1000),
+    RegisterField("salt_range", 94, 2, 2),
+    RegisterField("batt_capacity", 93, 3, 1),
+    RegisterField("water_flow", 790, 17, 2),
+    RegisterField("water_lock", 792, 1, 1, lambda raw: min(raw, 1)),
+    RegisterField("sleepmode", 792, 10, 1),
+    RegisterField("max_waterflow", 792, 13, 2),
+    RegisterField("extraction_quantity", 792, 15, 2),
+    RegisterField("extraction_time", 792, 17, 2),
+    RegisterField("holidaymode", 792, 19, 1, holidaymode_option),
+]
+
+# The Softwell P only reports the total water in register 9
+SOFTWELL_P_REGISTERS = [
+    RegisterField("total_water", 9, 0, 4, liters_to_m3),
+]
+
+
+# Registers changing at most a few times a day: revision (7), battery (93) and salt (94)
+# (like the versions and the device number in 1/2/3), all others may change with every poll
+SLOW_REGISTERS = frozenset({1, 2, 3, 7, 93, 94})
+
+
+def software_version(val):
+    minor = int.from_bytes(bytes.fromhex(val[2:4]), byteorder='little')
+    major = int.from_bytes(bytes.fromhex(val[4:6]), byteorder='little')
+    return f"{major}.{minor:02d}"
+
+
+def hardware_version(val):
+    minor = int.from_bytes(bytes.fromhex(val[0:2]), byteorder='little')
+    major = int.from_bytes(bytes.fromhex(val[2:4]), byteorder='little')
+    return f"{major}.{minor:02d}"
+
+
+def device_number(val):
+    return int.from_bytes(bytes.fromhex(val[0:8]), byteorder='little')
+
+
+# Diagnostic values: (attribute name of the entity, register index, decode function of the hex string)
+METADATA_REGISTERS = [
+    ("software_version", 1, software_version),
+    ("hardware_version", 2, hardware_version),
+    ("device_number", 3, device_number),
+]
+
+
+def register_map(use_with_softwell_p):
+    if use_with_softwell_p:
+        return COMMON_REGISTERS + SOFTWELL_P_REGISTERS
+    return COMMON_REGISTERS + SAFEPLUS_REGISTERS
+
+
+def split_register_map(fields, slow_registers=SLOW_REGISTERS):
+    """Returns (fast, slow) fields of a register map."""
+    return [f for f in fields if f.index not in slow_registers], [f for f in fields if f.index in slow_registers]
+
+
+_FORMATS = {1: "B", 2: "H", 4: "I"}
+
+
+class MetadataDecoder():
+    """Decodes the version and device number registers, memoized by their raw hex string.
+
+    They practically never change, decode() only returns the values whose raw string differs from the last call.
+    """
+    def __init__(self, fields=METADATA_REGISTERS):
+        self.fields = fields
+        self.raw = {}   # name -> last decoded hex string
+
+    def decode(self, registers: dict) -> dict:
+        values = {}
+        for name, index, decode in self.fields:
+            val = registers[str(index)]["data"]
+            if val == "" or self.raw.get(name) == val:
+                continue
+            values[name] = decode(val)
+            self.raw[name] = val
+        return values
+
+
+class RegisterDecoder():
+    """Decodes all fields of a register map, converting every register block only once.
+
+    The fields are grouped by register and compiled into one struct per register,
+    so a single unpack call yields all values of that block.
+    """
+    def __init__(self, fields: list[RegisterField]):
+        blocks = {}
+        for f in fields:
+            blocks.setdefault(f.index, []).append(f)
+
+        self.registers = []
+        for index, block in sorted(blocks.items()):
+            block.sort(key=lambda f: f.offset)
+            fmt = "<"
+            pos = 0
+            for f in block:
+                if f.offset < pos:
+                    raise ValueError(f"overlapping fields in register {index}: {f.name}")
+                fmt += "x" * (f.offset - pos) + _FORMATS[f.size]
+                pos = f.offset + f.size
+            self.registers.append((str(index), struct.Struct(fmt), tuple(block)))
+
+    def decode(self, registers: dict) -> dict:
+        """Returns {name: value} for all fields of non-empty registers.
+
+        registers is the "data" dict of a device, i.e. response_data["data"][0]["data"].
+        """
+        values = {}
+        for key, block_struct, block in self.registers:
+            val = registers[key]["data"]
+            if val == "":
+                continue
+            raw = bytes.fromhex(val)
+            if len(raw) >= block_struct.size:
+                numbers = block_struct.unpack_from(raw)
+            else:
+                # truncated register, decode what is available field by field
+                numbers = [int.from_bytes(raw[f.offset:f.offset + f.size], byteorder='little') for f in block]
+            for f, number in zip(block, numbers):
+                values[f.name] = f.transform(number) if f.transform else number
+        return values
+
+
+@lru_cache(maxsize=None)
+def register_decoders(use_with_softwell_p):
+    """Returns the (fast, slow) decoders of the register map, compiled once and shared by all devices."""
+    fast_registers, slow_registers = split_register_map(register_map(use_with_softwell_p))
+    return RegisterDecoder(fast_registers), RegisterDecoder(slow_registers)
@@ -0,0 +1,45 @@
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    # judo_device imports judo_session, which uses the registry
+    from judo_device import JudoDeviceConfig
+
+
+class DeviceRegistry():
+    """All configured devices, indexed by command topic and by serial number."""
+    def __init__(self, devices: list["JudoDeviceConfig"]):
+        self.devices = list(devices)
+        self.by_command_topic = {device.command_topic: device for device in self.devices}
+        self.by_serial = {device.SERIAL_NUMBER: device for device in self.devices if device.SERIAL_NUMBER != ""}
+
+    def __iter__(self):
+        return iter(self.devices)
+
+    def __len__(self):
+        return len(self.devices)
+
+    def assign_serial(self, device, serial):
+        device.SERIAL_NUMBER = serial
+        self.by_serial[serial] = device
+
+    def match(self, response_data_list):
+        """Yields (device, response data, newly associated) for every device found in the "data" list of the response.
+
+        Devices without a serial number are associated by their position in the config.
+        """
+        response_by_serial = {response_data["serialnumber"]: response_data for response_data in response_data_list}
+        for i, device in enumerate(self.devices):
+            if device.SERIAL_NUMBER == "":
+                # if no serial number is set, use the order of the devices in the config
+                if i >= len(response_data_list):
+                    # relevant device not found in response, skip it
+                    continue
+                response_data = response_data_list[i]
+                self.assign_serial(device, response_data["serialnumber"])
+                yield device, response_data, True
+            else:
+                response_data = response_by_serial.get(device.SERIAL_NUMBER)
+                if response_data is None:
+                    # relevant device not found in response, skip it
+                    continue
+                yield device, response_data, False
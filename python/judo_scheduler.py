@@ -0,0 +1,104 @@
+import time
+from threading import Event
+
+
+class Cadence():
+    """Slower rhythm within the poll cycles: due() is True on the first call and then at most every interval seconds."""
+    def __init__(self, interval=0):
+        self.interval = interval
+        self.next_time = 0.0
+
+    def due(self):
+        now = time.monotonic()
+        if now < self.next_time:
+            return False
+        self.next_time = now + self.interval
+        return True
+
+    def reset(self):
+        # due with the next call
+        self.next_time = 0.0
+
+
+class PollScheduler():
+    """Decides when the next poll of the myjudo.eu device data is due.
+
+    Without adaptive polling the interval is fixed. With adaptive polling every device gets its own
+    interval: it drops to POLL_INTERVAL_MIN while water is flowing, a regeneration is running or a
+    command was sent recently, and doubles after every idle poll up to POLL_INTERVAL_MAX.
+    All devices of the account are fetched with one request, so the shortest interval wins.
+    Every account has its own scheduler, the schedulers of all accounts share the wakeup event.
+    """
+    def __init__(self, devices, interval, adaptive=False, command_activity_time=60, wakeup=None):
+        self.devices = devices
+        self.interval = interval
+        self.adaptive = adaptive
+        self.command_activity_time = command_activity_time   # seconds a device counts as active after a command
+        self.device_intervals = {}
+        self.last_command = {}
+        self.next_poll = time.monotonic() + interval
+        self.requested = None       # earliest poll time requested by request_poll(), until a poll serves it
+        self.poll_start = None
+        self._wakeup = wakeup if wakeup is not None else Event()
+
+    def is_active(self, device):
+        if device.water_flow.value > 0 or device.regeneration_start.value > 0:
+            return True
+        last_command = self.last_command.get(device.client_id)
+        return last_command is not None and time.monotonic() - last_command < self.command_activity_time
+
+    def device_interval(self, device):
+        if not self.adaptive:
+            return self.interval
+        return self.device_intervals.get(device.client_id, device.POLL_INTERVAL_MIN)
+
+    def next_interval(self):
+        return min((self.device_interval(device) for device in self.devices), default=self.interval)
+
+    def start_poll(self):
+        # called when a poll begins, it serves the requests up to now
+        self.poll_start = time.monotonic()
+
+    def update(self):
+        # called after every poll
+        if self.adaptive:
+            for device in self.devices:
+                if self.is_active(device):
+                    interval = device.POLL_INTERVAL_MIN
+                else:
+                    # exponential backoff while the device is idle
+                    interval = min(2 * self.device_interval(device), device.POLL_INTERVAL_MAX)
+                self.device_intervals[device.client_id] = interval
+        if self.requested is not None and self.poll_start is not None and self.requested <= self.poll_start:
+            self.requested = None
+        # requests made during the poll (e.g. confirmation polls after a command) are not lost
+        next_poll = time.monotonic() + self.next_interval()
+        self.next_poll = next_poll if self.requested is None else min(self.requested, next_poll)
+
+    def command_sent(self, device):
+        self.last_command[device.client_id] = time.monotonic()
+        if self.adaptive:
+            self.device_intervals[device.client_id] = device.POLL_INTERVAL_MIN
+            self.request_poll(device.POLL_INTERVAL_MIN)
+
+    def request_poll(self, delay=0):
+        # bring the next poll forward, wakes up a waiting wait_any()
+        poll_time = time.monotonic() + delay
+        self.requested = poll_time if self.requested is None else min(self.requested, poll_time)
+        self.next_poll = min(self.next_poll, poll_time)
+        self._wakeup.set()
+
+    def is_due(self):
+        return time.monotonic() >= self.next_poll
+
+
+def wait_any(schedulers, stop: Event, wakeup: Event):
+    """Blocks until the next poll of at least one of the schedulers is due, returns False if stop was set."""
+    while not stop.is_set():
+        remaining = min(scheduler.next_poll for scheduler in schedulers) - time.monotonic()
+        if remaining <= 0:
+            return True
+        # wake up regularly to notice stop, and early on request_poll()
+        if wakeup.wait(min(remaining, 1)):
+            wakeup.clear()
+    return False
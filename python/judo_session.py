@@ -0,0 +1,176 @@
+import hashlib
+import logging
+import statistics
+import time
+from collections import deque
+from threading import Lock, Thread
+import messages_getjudo
+import judo_json
+from judo_circuit import CircuitBreaker
+from judo_events import ErrorHistory
+from judo_logging import LOGGER_NAME, add_secret
+from judo_registry import DeviceRegistry
+
+# the myjudo.eu interface answers requests with an invalid or expired token with this
+LOGIN_FAILED = b'"login failed"'
+
+
+class LoginError(Exception):
+    pass
+
+
+class JudoAccount():
+    """One myjudo.eu account with its own token, connection pool (via the cloud client) and devices.
+
+    The token is renewed ahead of its expiry (after token_max_age seconds, or shortly before the
+    median lifetime of the last rejected tokens) or when a request is rejected; concurrent renewals result in one login.
+    Tokens rejected before min_token_lifetime (e.g. invalidated by a login elsewhere) are not learned.
+    All requests pass the circuit breaker of the account, events finds the new entries of its error history.
+    """
+    def __init__(self, name, user, password, cloud, devices, token_max_age=0, breaker=None, events=None, scheduler=None,
+                 min_token_lifetime=0):
+        self.name = name
+        self.user = user
+        self.pwmd5 = hashlib.md5(password.encode("utf-8")).hexdigest()
+        self.cloud = cloud      # JudoCloudClient with the connection pool of this account
+        self.devices = DeviceRegistry(devices)
+        self.state = new_account_state()   # stored in mydata["accounts"][name]
+        self.token_max_age = token_max_age
+        self.min_token_lifetime = min_token_lifetime
+        self.token_lifetimes = deque(maxlen=5)   # lifetimes of the last rejected tokens
+        self.breaker = breaker if breaker is not None else CircuitBreaker()
+        self.events = events if events is not None else ErrorHistory()
+        self.scheduler = scheduler  # PollScheduler of the devices of this account
+        self.log = logging.getLogger(f"{LOGGER_NAME}.account.{name or 'default'}")
+        self._login_lock = Lock()
+
+    @property
+    def token(self):
+        return self.state["token"]
+
+    def token_age(self):
+        return time.time() - self.state["token_time"]
+
+    @property
+    def token_lifetime(self):
+        # 0 = unknown
+        return statistics.median(self.token_lifetimes) if self.token_lifetimes else 0
+
+    def refresh_age(self):
+        ages = [age for age in (self.token_max_age, 0.9 * self.token_lifetime) if age]
+        return min(ages, default=0)
+
+    def valid_token(self):
+        token = self.token
+        refresh_age = self.refresh_age()
+        if token == 0 or (refresh_age and self.token_age() >= refresh_age):
+            token = self.login(token)
+        return token
+
+    def login(self, old_token=None):
+        """Logs in and returns the new token, raises LoginError if the login is rejected.
+
+        If another thread has already replaced old_token in the meantime, its token is returned instead.
+        """
+        with self._login_lock:
+            if old_token is not None and self.token != old_token:
+                return self.token
+            login_response = self.cloud.login(self.user, self.pwmd5)
+            login_response_json = judo_json.loads(login_response.data)
+            if "token" not in login_response_json:
+                raise LoginError(messages_getjudo.debug[21])
+            token = login_response_json["token"]
+            add_secret(token)
+            self.log.info(messages_getjudo.debug[22].format(token))
+            self.state["token"] = token
+            self.state["token_time"] = time.time()
+            # update token in all device instances of the account
+            for device in self.devices:
+                device.save_data.token = token
+            return token
+
+    def request(self, function):
+        """Returns function(token); if the token is rejected, logs in again and repeats the request once.
+
+        Raises CircuitOpenError without sending anything while the circuit breaker is open.
+        """
+        self.breaker.check()
+        try:
+            response = self._request(function)
+        except LoginError:
+            # myjudo.eu has answered, rejected credentials are no outage
+            self.breaker.record_success()
+            raise
+        except Exception:
+            self.breaker.record_failure()
+            raise
+        if response.status >= 500:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        return response
+
+    def _request(self, function):
+        token = self.valid_token()
+        response = function(token)
+        if LOGIN_FAILED in response.data:
+            if self.state["token_time"]:
+                lifetime = time.time() - self.state["token_time"]
+                if lifetime >= self.min_token_lifetime:
+                    self.token_lifetimes.append(lifetime)
+            self.log.info(messages_getjudo.debug[23])
+            if self.cloud.metrics is not None:
+                self.cloud.metrics.inc("judo_relogins_total")
+            response = function(self.login(token))
+        return response
+
+
+def new_account_state():
+    return {"token": 0, "token_time": 0, "day_today": ""}
+
+
+class SessionManager():
+    """All accounts of the bridge, polled concurrently by at most max_workers threads."""
+    def __init__(self, accounts, max_workers=4):
+        self.accounts = list(accounts)
+        self.max_workers = max_workers
+
+    def __iter__(self):
+        return iter(self.accounts)
+
+    def __len__(self):
+        return len(self.accounts)
+
+    def map(self, function, accounts=None):
+        """Calls function(account) for the accounts (default: all), concurrently if there are several, returns the results.
+
+        Plain threads instead of a ThreadPoolExecutor: executors refuse work once the main thread
+        has finished, which is the normal state of the poll thread outside AppDaemon.
+        """
+        accounts = self.accounts if accounts is None else list(accounts)
+        if len(accounts) <= 1:
+            return [function(account) for account in accounts]
+        results = [None] * len(accounts)
+        errors = []
+        pending = iter(enumerate(accounts))
+        lock = Lock()
+
+        def worker():
+            while True:
+                with lock:
+                    i, account = next(pending, (None, None))
+                if account is None:
+                    return
+                try:
+                    results[i] = function(account)
+                except BaseException as e:
+                    errors.append(e)
+
+        threads = [Thread(target=worker, name=f"account-{i}", daemon=True) for i in range(min(self.max_workers, len(accounts)))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if errors:
+            raise errors[0]
+        return results
@@ -0,0 +1,71 @@
+import json
+import sqlite3
+from dataclasses import fields
+from threading import Lock
+from judo_device import JudoDeviceSafeData
+
+_GENERAL = "general"    # scope of the values not belonging to a device
+_DEVICE = "device/"     # scope prefix of the device values, followed by the serial number
+
+
+class StateStore():
+    """Persists the stored variables (mydata) in a SQLite database in WAL mode.
+
+    Every value is a row of its own. flush() only writes the values that changed since they were
+    last loaded or written and deletes the rows of removed values, all within one transaction,
+    so a crash never leaves a half written state.
+    """
+    def __init__(self, path):
+        self._lock = Lock()
+        self._stored = {}   # (scope, key) -> json of the value as it is in the database
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        with self._db:
+            self._db.execute("CREATE TABLE IF NOT EXISTS state (scope TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, PRIMARY KEY (scope, key))")
+
+    def load(self):
+        """Returns the stored mydata dict, or None if nothing has been stored yet."""
+        with self._lock:
+            rows = self._db.execute("SELECT scope, key, value FROM state").fetchall()
+            if not rows:
+                return None
+            mydata = {"accounts": {}, "devices": {}}
+            known_fields = {f.name for f in fields(JudoDeviceSafeData)}
+            for scope, key, value in rows:
+                self._stored[(scope, key)] = value
+                if scope == _GENERAL:
+                    mydata[key] = json.loads(value)
+                elif scope.startswith(_DEVICE) and key in known_fields:
+                    device_data = mydata["devices"].setdefault(scope[len(_DEVICE):], JudoDeviceSafeData())
+                    setattr(device_data, key, json.loads(value))
+            return mydata
+
+    def _rows(self, mydata):
+        for key, value in mydata.items():
+            if key != "devices":
+                yield _GENERAL, key, value
+        for serial, device_data in mydata["devices"].items():
+            for f in fields(JudoDeviceSafeData):
+                yield _DEVICE + serial, f.name, getattr(device_data, f.name)
+
+    def flush(self, mydata):
+        """Writes all changed values and deletes the removed ones, returns the number of written and deleted values."""
+        with self._lock:
+            dirty = []
+            present = set()
+            for scope, key, value in self._rows(mydata):
+                present.add((scope, key))
+                value = json.dumps(value)
+                if self._stored.get((scope, key)) != value:
+                    dirty.append((scope, key, value))
+            removed = [row for row in self._stored if row not in present]
+            if dirty or removed:
+                with self._db:
+                    self._db.executemany("INSERT OR REPLACE INTO state (scope, key, value) VALUES (?, ?, ?)", dirty)
+                    self._db.executemany("DELETE FROM state WHERE scope = ? AND key = ?", removed)
+                for scope, key, value in dirty:
+                    self._stored[(scope, key)] = value
+                for row in removed:
+                    del self._stored[row]
+            return len(dirty) + len(removed)
@@ -32,13 +32,16 @@ if config_getjudo.LANGUAGE == "DE":
         20 : "Urlaubsmodus",
         21 : "Stunden_seit_letzter_Regeneration",
         22 : "durchschn_Regenerationsintervall",
-        23 : "Mischungsverhaeltnis_Weich_Hart"
+        23 : "Mischungsverhaeltnis_Weich_Hart",
+        24 : "Softwareversion",
+        25 : "Hardwareversion",
+        26 : "Geraetenummer"
     }
 
     debug = {
         1: "Verbunden mit MQTT Broker...",
         2: "Topics wurden abonniert...",
-        3: "Autoconfigs wurden gesendet...",
+        3: "{} von {} Autoconfigs wurden gesendet, die übrigen sind unverändert...",
         4: "Verbindung fehlgeschlagen, Fehlercode {}", #{rc}
         5: "Eingehende Nachricht: {}{}", #{message.topic},{message.payload}
         6: "Falscher Befehl!!",
@@ -81,6 +84,16 @@ if config_getjudo.LANGUAGE == "DE":
         43: "Errechneter Natriumgehalt: {}mg/L < {}mg/L bei {}°dH",
         44: "Natriumgrenzwert würde überschritten werden. Wunschwasserhärte wird auf {} °dH gesetzt",
         45: "Device {} associated to serialnumber {}",
+        46: "Keine Änderungen, Veröffentlichung übersprungen (übersprungen: {}, gesendet: {})",
+        47: "Befehl für Index {} nach {} Versuch(en) fehlgeschlagen",
+        48: "{} wurde vom Gerät nicht übernommen (gesetzt: {}, gemeldet: {})",
+        49: "Profiling der nächsten {} Zyklen gestartet",
+        50: "Profiling beendet, Ergebnis: {}",
+        51: "Unbekannter Account \"{}\" bei Gerät {}, bitte JUDO_ACCOUNTS prüfen",
+        52: "myjudo.eu nicht erreichbar, nächster Versuch in {:.0f} s",
+        53: "myjudo.eu wieder erreichbar",
+        54: "Unbekannte Warnung (Code {})",
+        55: "Unbekannter Fehler (Code {})",
     }
 
     warnings = {
@@ -171,13 +184,16 @@ else:
         20: "Holiday_mode",
         21 : "Hours_since_last_regeneration",
         22 : "Avg_regeneration_interval",
-        23 : "Mix_ratio_Soft:Hard"
+        23 : "Mix_ratio_Soft:Hard",
+        24 : "Software_version",
+        25 : "Hardware_version",
+        26 : "Device_number"
     }
 
     debug = {
         1: "Connected to MQTT Broker...",
         2: "Topics has been subscribed...",
-        3: "Autoconfigs has been sent...",
+        3: "{} of {} autoconfigs have been sent, the others are unchanged...",
         4: "Failed to connect, return code {}",
         5: "Incomming Message: {}{}",
         6: "Command_Name_Error!!",
@@ -195,7 +211,7 @@ else:
         18: "{} has been set to {} successfully",
         19: "HTTP Error while setting {}",
         20: "failed by int to hex conversion",
-        21: "myjudo.eu login failed! - Wrong credentials?? EXIT",
+        21: "myjudo.eu login failed! - Wrong credentials??",
         22: "Login successful, got new token: {}", #{login_response_json['token']} !!!!Attention, Don't Post or Publish this Token anywhere. It allows grand access to the plant!!!!",
         23: "Error: No valid Token, trying to get a new one...",
         24: "Response Error: {}",
@@ -218,7 +234,18 @@ else:
         41: "Temp-file seems to be currupt or not existent, writing a new one",
         42: "Canceling Script, Fatal Error on line: {}",
         43: "Calculated sodium content: {}mg/L < {}mg/L at {}°dH",
-        44: "Sodium level would be exceeded. Desired hardness set to {} °dH"
+        44: "Sodium level would be exceeded. Desired hardness set to {} °dH",
+        45: "Device {} associated to serialnumber {}",
+        46: "No changes, publish skipped (skipped: {}, sent: {})",
+        47: "Command for index {} failed after {} attempt(s)",
+        48: "{} was not taken over by the device (set: {}, reported: {})",
+        49: "Profiling of the next {} cycles started",
+        50: "Profiling finished, result: {}",
+        51: "Unknown account \"{}\" of device {}, please check JUDO_ACCOUNTS",
+        52: "myjudo.eu not reachable, next attempt in {:.0f} s",
+        53: "myjudo.eu reachable again",
+        54: "Unknown warning (code {})",
+        55: "Unknown error (code {})",
     }
 
 
@@ -0,0 +1,103 @@
+"""Tests of the retries of commands sent to myjudo.eu.
+
+Run from the repository root: python3 -m unittest discover tests
+"""
+import logging
+import os
+import sys
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "python"))
+try:
+    import config_getjudo
+except ImportError:
+    import config_getjudo_default as config_getjudo
+    sys.modules["config_getjudo"] = config_getjudo
+
+from urllib3.exceptions import ProtocolError
+import messages_getjudo
+from judo_circuit import CircuitOpenError
+from judo_device import JudoDeviceConfig
+from judo_logging import LOGGER_NAME
+from judo_session import LoginError
+
+
+class StubMQTTClient():
+    def __init__(self):
+        self.messages = []
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        self.messages.append((topic, payload))
+
+
+class StubAccount():
+    """Answers the requests with the given results in turn, exceptions are raised."""
+    def __init__(self, *results):
+        self.results = list(results)
+        self.requests = 0
+
+    def request(self, function):
+        self.requests += 1
+        result = self.results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return SimpleNamespace(status=200, data=result)
+
+
+class SendCommandTest(unittest.TestCase):
+    def setUp(self):
+        self.device = JudoDeviceConfig(
+            availability_topic="test/status", MQTT_DEBUG_LEVEL=3, COMMAND_RETRIES=3, COMMAND_RETRY_DELAY=2,
+            **config_getjudo.DEVICES[0])
+        self.device.setup_entities()
+        self.client = StubMQTTClient()
+        self.device._client = self.client
+        handler = logging.NullHandler()
+        logging.getLogger(LOGGER_NAME).addHandler(handler)
+        self.addCleanup(logging.getLogger(LOGGER_NAME).removeHandler, handler)
+        patcher = mock.patch("judo_device.time.sleep")
+        self.sleep = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def send(self, *results):
+        self.device._account = StubAccount(*results)
+        return self.device.send_command(60, "0A00")
+
+    def notifications(self):
+        return [payload for topic, payload in self.client.messages if topic == self.device.notification_topic]
+
+    def test_success(self):
+        self.assertTrue(self.send(b'{"status": "ok"}'))
+        self.sleep.assert_not_called()
+
+    def test_network_errors_are_retried(self):
+        self.assertTrue(self.send(ProtocolError("reset"), ValueError("no JSON"), b'{"status": "ok"}'))
+        self.assertEqual(self.device._account.requests, 3)
+        self.assertEqual([c.args[0] for c in self.sleep.call_args_list], [2, 4])
+
+    def test_retries_are_limited(self):
+        self.assertFalse(self.send(*[ProtocolError("reset")] * 4))
+        self.assertEqual(self.device._account.requests, 4)
+        self.assertEqual(self.sleep.call_count, 3)
+
+    def test_open_circuit_fails_at_once(self):
+        self.assertFalse(self.send(CircuitOpenError()))
+        self.assertEqual(self.device._account.requests, 1)
+        self.sleep.assert_not_called()
+        self.assertEqual(self.notifications(), [messages_getjudo.debug[47].format(60, 1)])
+
+    def test_rejected_login_fails_at_once(self):
+        self.assertFalse(self.send(LoginError(messages_getjudo.debug[21])))
+        self.assertEqual(self.device._account.requests, 1)
+        self.sleep.assert_not_called()
+
+    def test_script_error_is_not_retried(self):
+        self.assertFalse(self.send(KeyError("dt")))
+        self.assertEqual(self.device._account.requests, 1)
+        self.sleep.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+"""Tests of the detection of new entries in the error history.
+
+Run from the repository root: python3 -m unittest discover tests
+"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "python"))
+try:
+    import config_getjudo
+except ImportError:
+    import config_getjudo_default as config_getjudo
+    sys.modules["config_getjudo"] = config_getjudo
+
+from judo_device import JudoDeviceConfig
+from judo_events import ErrorHistory
+from judo_registry import DeviceRegistry
+
+
+def entry(id, serial="100000", error=1):
+    return {"id": id, "serialnumber": serial, "type": "w", "error": error, "ts_sort": ""}
+
+
+class ErrorHistoryTest(unittest.TestCase):
+    def setUp(self):
+        self.devices = [
+            JudoDeviceConfig(availability_topic="test/status", MQTT_DEBUG_LEVEL=0, **dict(config_getjudo.DEVICES[0], NAME=f"dev{serial}", SERIAL_NUMBER=serial))
+            for serial in ("100000", "100001")]
+        self.registry = DeviceRegistry(self.devices)
+        self.events = ErrorHistory()
+
+    def new_ids(self, entries):
+        return [(device.SERIAL_NUMBER, entry["id"]) for device, entry in self.events.new_events(self.registry, entries)]
+
+    def test_new_installation_only_gets_the_newest_entry(self):
+        self.assertEqual(self.new_ids([entry("12"), entry("11"), entry("10")]), [("100000", "12")])
+        self.assertEqual(self.devices[0].save_data.last_err_id, 12)
+
+    def test_new_entries_oldest_first(self):
+        self.devices[0].save_data.last_err_id = 10
+        self.devices[1].save_data.last_err_id = 10
+        history = [entry("13", "100001"), entry("12"), entry("11", "100001"), entry("10")]
+        self.assertEqual(self.new_ids(history), [("100001", "11"), ("100000", "12"), ("100001", "13")])
+        self.assertEqual(self.new_ids(history), [])
+
+    def test_unknown_serial_is_ignored(self):
+        self.devices[0].save_data.last_err_id = 10
+        self.assertEqual(self.new_ids([entry("11", "999999")]), [])
+
+    def test_non_numeric_ids(self):
+        history = [entry("b7f2"), entry("a1c9")]
+        with self.assertLogs("getjudo.events", "WARNING") as logs:
+            self.assertEqual(self.new_ids(history), [("100000", "b7f2")])
+        self.assertEqual(len(logs.records), 1)
+        self.assertEqual(self.new_ids(history), [])
+        # only the new entries, although their ids can't be compared
+        history = [entry("ff01"), entry("0c3d")] + history
+        self.assertEqual(self.new_ids(history), [("100000", "0c3d"), ("100000", "ff01")])
+        self.assertEqual(self.new_ids(history), [])
+
+    def test_mixed_ids(self):
+        self.devices[0].save_data.last_err_id = 10
+        history = [entry("x2"), entry("11"), entry("10")]
+        with self.assertLogs("getjudo.events", "WARNING"):
+            self.assertEqual(self.new_ids(history), [("100000", "11"), ("100000", "x2")])
+        self.assertEqual(self.new_ids(history), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
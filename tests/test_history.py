@@ -0,0 +1,149 @@
+"""Tests of the history files.
+
+Run from the repository root: python3 -m unittest discover tests
+"""
+import os
+import sys
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "python"))
+
+from judo_history import DeviceHistory, HistoryRecorder
+
+CAPACITIES = {"raw": 50, "minute": 20, "hour": 10, "day": 5}
+
+
+def entities(flow, total):
+    return [
+        SimpleNamespace(name="water_flow", value=flow, entity_type="sensor"),
+        SimpleNamespace(name="total_water", value=total, entity_type="sensor"),
+        SimpleNamespace(name="software_version", value=2.14, entity_type="diagnostic"),
+    ]
+
+
+class DeviceHistoryFileTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "100000.hist")
+        self.history = DeviceHistory(CAPACITIES)
+        self.time = 1_700_000_000
+
+    def record(self, n):
+        for _ in range(n):
+            self.time += 20
+            self.history.record(entities(self.time % 500, self.time / 1000), self.time)
+
+    def assertSameHistory(self, loaded, history):
+        self.assertEqual(list(loaded.series), list(history.series))
+        for name, series in history.series.items():
+            self.assertEqual(loaded.series[name].buckets, series.buckets)
+            for tier, buf in series.tiers.items():
+                with self.subTest(entity=name, tier=tier):
+                    self.assertEqual(list(loaded.series[name].tiers[tier]), list(buf))
+
+    def test_round_trip(self):
+        self.record(10)
+        self.history.save(self.path)
+        self.assertSameHistory(DeviceHistory.load(self.path), self.history)
+        self.assertNotIn("software_version", self.history.series)
+
+    def test_incremental_saves_write_in_place(self):
+        self.record(10)
+        self.history.save(self.path)
+        inode = os.stat(self.path).st_ino
+        size = os.path.getsize(self.path)
+        # many saves, the raw ring wraps around several times
+        for _ in range(12):
+            self.record(7)
+            self.history.save(self.path)
+        self.assertEqual(os.stat(self.path).st_ino, inode)
+        self.assertEqual(os.path.getsize(self.path), size)
+        self.assertSameHistory(DeviceHistory.load(self.path), self.history)
+
+    def test_incremental_save_only_writes_the_changes(self):
+        self.record(10)
+        self.history.save(self.path)
+        self.record(3)
+        written = []
+        real_open = open
+
+        def counting_open(*args, **kwargs):
+            f = real_open(*args, **kwargs)
+            write = f.write
+            f.write = lambda data: written.append(len(data)) or write(data)
+            return f
+        with mock.patch("builtins.open", counting_open):
+            self.history.save(self.path)
+        self.assertLess(sum(written), 4096)
+        self.assertSameHistory(DeviceHistory.load(self.path), self.history)
+
+    def test_continue_after_load(self):
+        self.record(10)
+        self.history.save(self.path)
+        loaded = DeviceHistory.load(self.path, CAPACITIES)
+        self.history = loaded
+        self.record(60)
+        loaded.save(self.path)
+        self.assertSameHistory(DeviceHistory.load(self.path), loaded)
+
+    def test_new_entity_rewrites_the_file(self):
+        self.record(10)
+        self.history.save(self.path)
+        self.history.record([SimpleNamespace(name="salt_stock", value=20.0, entity_type="number")], self.time)
+        self.history.save(self.path)
+        loaded = DeviceHistory.load(self.path)
+        self.assertIn("salt_stock", loaded.series)
+        self.assertSameHistory(loaded, self.history)
+
+    def test_interrupted_save_keeps_the_previous_state(self):
+        self.record(10)
+        self.history.save(self.path)
+        self.record(5)
+        self.history.save(self.path)
+        expected = [list(series.tiers["raw"]) for series in self.history.series.values()]
+        # the records are written, but the save is interrupted before the state
+        self.record(5)
+        with mock.patch.object(DeviceHistory, "_slot", side_effect=OSError("disk full")):
+            with self.assertRaises(OSError):
+                self.history.save(self.path)
+        loaded = DeviceHistory.load(self.path)
+        self.assertEqual([list(series.tiers["raw"]) for series in loaded.series.values()], expected)
+        # the next save completes it
+        self.history.save(self.path)
+        self.assertSameHistory(DeviceHistory.load(self.path), self.history)
+
+    def test_corrupt_state_falls_back_to_the_older_slot(self):
+        self.record(10)
+        self.history.save(self.path)
+        first = [list(series.tiers["raw"]) for series in self.history.series.values()]
+        self.record(5)
+        self.history.save(self.path)
+        # damage the newer state (second slot)
+        with open(self.path, "r+b") as f:
+            f.seek(self.history._data_offset - self.history._slot_size + 20)
+            f.write(b"xx")
+        loaded = DeviceHistory.load(self.path)
+        self.assertEqual([list(series.tiers["raw"]) for series in loaded.series.values()], first)
+
+
+class HistoryRecorderTest(unittest.TestCase):
+    def test_corrupt_file_is_moved_aside(self):
+        with tempfile.TemporaryDirectory() as directory:
+            recorder = HistoryRecorder(directory, capacities=CAPACITIES)
+            path = recorder.path("100000")
+            with open(path, "wb") as f:
+                f.write(b"JUDOHIST2\n{")
+            device = SimpleNamespace(SERIAL_NUMBER="100000", NAME="Judo", entities=entities(100, 1.5))
+            with self.assertLogs("getjudo.history", "WARNING"):
+                recorder.record(device)
+            self.assertTrue(os.path.exists(path + ".corrupt"))
+            recorder.save(force=True)
+            self.assertIn("water_flow", DeviceHistory.load(path).series)
+
+
+if __name__ == "__main__":
+    unittest.main()
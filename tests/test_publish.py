@@ -0,0 +1,134 @@
+"""Tests of the change detection that skips state publishes without meaningful changes.
+
+Run from the repository root: python3 -m unittest discover tests
+"""
+import os
+import sys
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "python"))
+try:
+    import config_getjudo
+except ImportError:
+    import config_getjudo_default as config_getjudo
+    sys.modules["config_getjudo"] = config_getjudo
+
+from judo_device import JudoDeviceConfig
+from judo_publish import ChangeDetector
+
+
+def entity(value, deadband=0, name="water_flow"):
+    return SimpleNamespace(name=name, value=value, deadband=deadband)
+
+
+class ChangeDetectorTest(unittest.TestCase):
+    def setUp(self):
+        self.changes = ChangeDetector(refresh_interval=600)
+
+    def test_unpublished_entity_is_changed(self):
+        self.assertTrue(self.changes.is_changed(entity(100, deadband=5)))
+
+    def test_change_within_deadband_is_suppressed(self):
+        flow = entity(100, deadband=5)
+        self.changes.mark_published([flow])
+        for value in (100, 105, 95, 103.5):
+            flow.value = value
+            with self.subTest(value):
+                self.assertFalse(self.changes.is_changed(flow))
+
+    def test_change_beyond_deadband_is_published(self):
+        flow = entity(100, deadband=5)
+        self.changes.mark_published([flow])
+        for value in (106, 94, 105.5):
+            flow.value = value
+            with self.subTest(value):
+                self.assertTrue(self.changes.is_changed(flow))
+
+    def test_small_changes_do_not_accumulate(self):
+        # the deadband is measured from the last published value, not from the last polled one
+        flow = entity(100, deadband=5)
+        self.changes.mark_published([flow])
+        flow.value = 104
+        self.assertFalse(self.changes.is_changed(flow))
+        flow.value = 108
+        self.assertTrue(self.changes.is_changed(flow))
+        self.changes.mark_published([flow])
+        flow.value = 104
+        self.assertFalse(self.changes.is_changed(flow))
+
+    def test_without_deadband_every_change_is_published(self):
+        hardness = entity(8, name="output_hardness")
+        self.changes.mark_published([hardness])
+        self.assertFalse(self.changes.is_changed(hardness))
+        hardness.value = 9
+        self.assertTrue(self.changes.is_changed(hardness))
+
+    def test_non_numeric_values_are_compared_exactly(self):
+        mode = entity("off", deadband=5, name="holidaymode")
+        self.changes.mark_published([mode])
+        self.assertFalse(self.changes.is_changed(mode))
+        mode.value = "lock"
+        self.assertTrue(self.changes.is_changed(mode))
+        switch = entity(False, deadband=5, name="water_lock")
+        self.changes.mark_published([switch])
+        switch.value = True
+        self.assertTrue(self.changes.is_changed(switch))
+
+    def test_forced_refresh(self):
+        with mock.patch("judo_publish.time.monotonic", return_value=1000):
+            self.assertTrue(self.changes.refresh_due())
+            self.changes.mark_published([entity(100)], full=True)
+            self.assertFalse(self.changes.refresh_due())
+        with mock.patch("judo_publish.time.monotonic", return_value=1599):
+            self.assertFalse(self.changes.refresh_due())
+            # a publish of the changed entities only does not restart the interval
+            self.changes.mark_published([entity(200)])
+        with mock.patch("judo_publish.time.monotonic", return_value=1600):
+            self.assertTrue(self.changes.refresh_due())
+
+
+class StubMQTTClient():
+    def __init__(self):
+        self.messages = []
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        self.messages.append((topic, payload))
+
+
+class PublishOnlyChangesTest(unittest.TestCase):
+    def setUp(self):
+        device_dict = dict(config_getjudo.DEVICES[0])
+        self.device = JudoDeviceConfig(
+            availability_topic="test/status", MQTT_DEBUG_LEVEL=0,
+            PUBLISH_ONLY_CHANGES=True, STATE_TOPIC_MODE="json", FORCED_REFRESH_INTERVAL=600, **device_dict)
+        self.device.setup_entities()
+        self.client = StubMQTTClient()
+        self.device._client = self.client
+        self.monotonic = mock.patch("judo_publish.time.monotonic", return_value=1000)
+        self.monotonic.start()
+        self.addCleanup(self.monotonic.stop)
+        self.device.water_flow.value = 100
+        self.assertTrue(self.device.publish_entities())
+
+    def test_change_within_deadband_is_suppressed(self):
+        self.device.water_flow.value = 100 + self.device.water_flow.deadband
+        self.assertFalse(self.device.publish_entities())
+        self.assertEqual(len(self.client.messages), 1)
+        self.assertEqual(self.device._changes.suppressed, 1)
+
+    def test_change_beyond_deadband_is_published(self):
+        self.device.water_flow.value = 101 + self.device.water_flow.deadband
+        self.assertTrue(self.device.publish_entities())
+        self.assertEqual(len(self.client.messages), 2)
+
+    def test_forced_refresh_publishes_unchanged_values(self):
+        self.assertFalse(self.device.publish_entities())
+        with mock.patch("judo_publish.time.monotonic", return_value=1600):
+            self.assertTrue(self.device.publish_entities())
+        self.assertEqual(len(self.client.messages), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,154 @@
+"""Tests of the register decoding against the hand-written decoding of update_entities() it replaced.
+
+Run from the repository root: python3 -m unittest discover tests
+"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "python"))
+try:
+    import config_getjudo
+except ImportError:
+    import config_getjudo_default as config_getjudo
+    sys.modules["config_getjudo"] = config_getjudo
+
+import messages_getjudo
+from judo_registers import MetadataDecoder, RegisterDecoder, register_decoders, register_map
+
+# Device of a "get device data" response of an i-soft save+, the register blocks have their original lengths.
+# Neighbouring bytes all differ, so a field read at a wrong offset or with a wrong size gets a wrong value.
+DEVICE_DATA = {
+    "serialnumber": "100000",
+    "data": [{"da": "1", "dt": "0x33", "data": {
+        "1": {"data": "000e0200"},
+        "2": {"data": "03010000"},
+        "3": {"data": "a0860100"},
+        "7": {"data": "e0e1e2e3"},
+        "8": {"data": "45464748"},
+        "9": {"data": "5c5d5e5f"},
+        "93": {"data": "11121314"},
+        "94": {"data": "a8a9aaab"},
+        "790": {"data": "2122232425262728292a2b2c2d2e2f303132333435363738393a3b3c3d3e3f40"},
+        "791": {"data": "4142434445464748494a4b4c4d4e4f505152535455565758595a5b5c5d5e5f606162"},
+        "792": {"data": "6162636465666768696a6b6c6d6e6f70717273057576"},
+    }}],
+}
+REGISTERS = DEVICE_DATA["data"][0]["data"]
+
+
+def hex_field(device_data, index, a, b):
+    """Entity.parse() of the original version, a and b are offsets in the hex string."""
+    val = device_data["data"][0]["data"][str(index)]["data"]
+    return int.from_bytes(bytes.fromhex(val[a:b]), byteorder='little')
+
+
+def legacy_decode(device_data, use_with_softwell_p):
+    """The decoding of update_entities() before the register map, without the bookkeeping of the statistics."""
+    values = {"next_revision": hex_field(device_data, 7, 0, 4)}
+    if not use_with_softwell_p:
+        values["total_water"] = hex_field(device_data, 8, 0, 8)
+        values["salt_stock"] = hex_field(device_data, 94, 0, 4)
+        values["salt_range"] = hex_field(device_data, 94, 4, 8)
+        values["total_softwater_proportion"] = hex_field(device_data, 9, 0, 8)
+        values["water_flow"] = hex_field(device_data, 790, 34, 38)
+        values["batt_capacity"] = hex_field(device_data, 93, 6, 8)
+        values["water_lock"] = hex_field(device_data, 792, 2, 4)
+        values["sleepmode"] = hex_field(device_data, 792, 20, 22)
+        values["max_waterflow"] = hex_field(device_data, 792, 26, 30)
+        values["extraction_quantity"] = hex_field(device_data, 792, 30, 34)
+        values["extraction_time"] = hex_field(device_data, 792, 34, 38)
+        values["holidaymode"] = hex_field(device_data, 792, 38, 40)
+    else:
+        values["total_water"] = hex_field(device_data, 9, 0, 8)
+
+    values["output_hardness"] = hex_field(device_data, 790, 18, 20)
+    values["input_hardness"] = hex_field(device_data, 790, 54, 56)
+    values["regenerations"] = hex_field(device_data, 791, 62, 66)
+    values["regeneration_start"] = hex_field(device_data, 791, 2, 4)
+
+    values["next_revision"] = int(values["next_revision"]/24)
+    values["total_water"] = float(values["total_water"]/1000)
+
+    if not use_with_softwell_p:
+        if values["holidaymode"] == 3:
+            values["holidaymode"] = messages_getjudo.holiday_options[2]
+        elif values["holidaymode"] == 5:
+            values["holidaymode"] = messages_getjudo.holiday_options[3]
+        elif values["holidaymode"] == 9:
+            values["holidaymode"] = messages_getjudo.holiday_options[1]
+        else:
+            values["holidaymode"] = messages_getjudo.holiday_options[0]
+        values["total_softwater_proportion"] = float(values["total_softwater_proportion"]/1000)
+        values["salt_stock"] /= 1000
+        if values["water_lock"] > 1:
+            values["water_lock"] = 1
+
+    values["regeneration_start"] &= 0x0F
+    if values["regeneration_start"] > 0:
+        values["regeneration_start"] = 1
+    return values
+
+
+def decode(registers, use_with_softwell_p):
+    fast, slow = register_decoders(use_with_softwell_p)
+    return {**fast.decode(registers), **slow.decode(registers)}
+
+
+class RegisterDecoderTest(unittest.TestCase):
+    def test_safeplus_matches_legacy_decoding(self):
+        values = decode(REGISTERS, False)
+        expected = legacy_decode(DEVICE_DATA, False)
+        self.assertEqual(values.keys(), expected.keys())
+        for name, value in expected.items():
+            with self.subTest(name):
+                self.assertEqual(values[name], value)
+                self.assertIs(type(values[name]), type(value))
+
+    def test_softwell_p_matches_legacy_decoding(self):
+        values = decode(REGISTERS, True)
+        expected = legacy_decode(DEVICE_DATA, True)
+        self.assertEqual(values.keys(), expected.keys())
+        for name, value in expected.items():
+            with self.subTest(name):
+                self.assertEqual(values[name], value)
+                self.assertIs(type(values[name]), type(value))
+
+    def test_known_values(self):
+        values = decode(REGISTERS, False)
+        self.assertEqual(values["next_revision"], 0xe1e0 // 24)
+        self.assertEqual(values["total_water"], 0x48474645 / 1000)
+        self.assertEqual(values["water_flow"], 0x3332)
+        self.assertEqual(values["input_hardness"], 0x3c)
+        self.assertEqual(values["regenerations"], 0x6160)
+        self.assertEqual(values["regeneration_start"], 1)
+        self.assertEqual(values["water_lock"], 1)
+        self.assertEqual(values["holidaymode"], messages_getjudo.holiday_options[3])
+
+    def test_empty_register_is_skipped(self):
+        registers = dict(REGISTERS)
+        registers["792"] = {"data": ""}
+        values = RegisterDecoder(register_map(False)).decode(registers)
+        self.assertNotIn("holidaymode", values)
+        self.assertNotIn("water_lock", values)
+        self.assertIn("water_flow", values)
+
+    def test_truncated_register_matches_legacy_decoding(self):
+        registers = dict(REGISTERS)
+        registers["790"] = {"data": REGISTERS["790"]["data"][:40]}
+        device_data = {"data": [{"data": registers}]}
+        values = RegisterDecoder(register_map(False)).decode(registers)
+        self.assertEqual(values["output_hardness"], hex_field(device_data, 790, 18, 20))
+        self.assertEqual(values["water_flow"], hex_field(device_data, 790, 34, 38))
+        self.assertEqual(values["input_hardness"], 0)
+
+    def test_metadata(self):
+        decoder = MetadataDecoder()
+        self.assertEqual(decoder.decode(REGISTERS), {
+            "software_version": "2.14", "hardware_version": "1.03", "device_number": 100000})
+        # unchanged raw values are not decoded again
+        self.assertEqual(decoder.decode(REGISTERS), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
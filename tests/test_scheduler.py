@@ -0,0 +1,74 @@
+"""Tests of the poll scheduling.
+
+Run from the repository root: python3 -m unittest discover tests
+"""
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "python"))
+
+from judo_scheduler import PollScheduler
+
+
+class Clock():
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class PollSchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+        patcher = mock.patch("judo_scheduler.time.monotonic", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.scheduler = PollScheduler([], interval=20)
+
+    def poll(self, duration=1, during=None):
+        # one poll cycle as main() runs it
+        self.scheduler.start_poll()
+        self.clock.now += duration
+        if during is not None:
+            during()
+        self.scheduler.update()
+
+    def test_regular_interval(self):
+        self.poll()
+        self.assertEqual(self.scheduler.next_poll, self.clock.now + 20)
+
+    def test_request_during_poll_survives_update(self):
+        # reconcile_expected() requests the confirmation poll in the middle of the poll
+        self.poll(during=lambda: self.scheduler.request_poll(5))
+        self.assertEqual(self.scheduler.next_poll, self.clock.now + 5)
+
+    def test_request_is_cleared_by_the_poll_serving_it(self):
+        self.poll(during=lambda: self.scheduler.request_poll(5))
+        self.clock.now = self.scheduler.next_poll
+        self.assertTrue(self.scheduler.is_due())
+        self.poll()
+        self.assertEqual(self.scheduler.next_poll, self.clock.now + 20)
+
+    def test_request_served_by_the_running_poll(self):
+        self.scheduler.request_poll(0)
+        self.poll()
+        self.assertEqual(self.scheduler.next_poll, self.clock.now + 20)
+
+    def test_earliest_request_wins(self):
+        def requests():
+            self.scheduler.request_poll(8)
+            self.scheduler.request_poll(3)
+            self.scheduler.request_poll(5)
+        self.poll(during=requests)
+        self.assertEqual(self.scheduler.next_poll, self.clock.now + 3)
+
+    def test_request_after_interval_does_not_delay_the_poll(self):
+        self.poll(during=lambda: self.scheduler.request_poll(60))
+        self.assertEqual(self.scheduler.next_poll, self.clock.now + 20)
+
+
+if __name__ == "__main__":
+    unittest.main()
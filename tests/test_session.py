@@ -0,0 +1,96 @@
+"""Tests of the token handling of the accounts.
+
+Run from the repository root: python3 -m unittest discover tests
+"""
+import os
+import sys
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "python"))
+try:
+    import config_getjudo
+except ImportError:
+    import config_getjudo_default as config_getjudo
+    sys.modules["config_getjudo"] = config_getjudo
+
+from judo_session import JudoAccount, LOGIN_FAILED
+
+
+class StubCloud():
+    """Hands out numbered tokens and rejects the token in use when reject() was called."""
+    metrics = None
+
+    def __init__(self):
+        self.logins = 0
+        self.rejected = None
+
+    def login(self, username, pwmd5):
+        self.logins += 1
+        return SimpleNamespace(data=b'{"token": "token%d"}' % self.logins)
+
+    def reject(self, token):
+        self.rejected = token
+
+    def get_device_data(self, token):
+        if token == self.rejected:
+            return SimpleNamespace(status=200, data=LOGIN_FAILED)
+        return SimpleNamespace(status=200, data=b'{"status": "ok"}')
+
+
+class Clock():
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class TokenLifetimeTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+        patcher = mock.patch("judo_session.time.time", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.cloud = StubCloud()
+        self.account = JudoAccount("", "user", "password", self.cloud, [], min_token_lifetime=60)
+
+    def expire_after(self, seconds):
+        # the current token is rejected after the given lifetime
+        self.account.request(self.cloud.get_device_data)
+        self.clock.now += seconds
+        self.cloud.reject(self.account.token)
+        self.account.request(self.cloud.get_device_data)
+
+    def test_lifetime_unknown_at_start(self):
+        self.assertEqual(self.account.refresh_age(), 0)
+
+    def test_lifetime_is_learned(self):
+        self.expire_after(3600)
+        self.assertEqual(self.account.token_lifetime, 3600)
+        self.assertEqual(self.account.refresh_age(), 0.9 * 3600)
+
+    def test_early_rejection_is_not_learned(self):
+        # e.g. the token was invalidated by a login of the app shortly after the login of the bridge
+        self.expire_after(5)
+        self.assertEqual(self.account.token_lifetime, 0)
+        logins = self.cloud.logins
+        self.clock.now += 30
+        self.account.request(self.cloud.get_device_data)
+        self.assertEqual(self.cloud.logins, logins)
+
+    def test_single_short_lifetime_does_not_take_over(self):
+        # the median of the observed lifetimes, not the shortest one
+        for lifetime in (3600, 120):
+            self.expire_after(lifetime)
+        self.assertEqual(self.account.token_lifetime, (3600 + 120) / 2)
+
+    def test_token_max_age_limits_refresh_age(self):
+        self.account.token_max_age = 600
+        self.expire_after(3600)
+        self.assertEqual(self.account.refresh_age(), 600)
+
+
+if __name__ == "__main__":
+    unittest.main()
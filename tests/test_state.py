@@ -0,0 +1,54 @@
+"""Tests of the SQLite state store.
+
+Run from the repository root: python3 -m unittest discover tests
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "python"))
+try:
+    import config_getjudo
+except ImportError:
+    import config_getjudo_default as config_getjudo
+    sys.modules["config_getjudo"] = config_getjudo
+
+from judo_device import JudoDeviceSafeData
+from judo_state import StateStore
+
+
+class StateStoreTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "state.db")
+        self.store = StateStore(self.path)
+
+    def rows(self):
+        with sqlite3.connect(self.path) as db:
+            return {(scope, key) for scope, key in db.execute("SELECT scope, key FROM state")}
+
+    def test_only_changes_are_written(self):
+        mydata = {"accounts": {"": {"token": "abc"}}, "devices": {"100000": JudoDeviceSafeData()}}
+        self.assertGreater(self.store.flush(mydata), 0)
+        self.assertEqual(self.store.flush(mydata), 0)
+        mydata["devices"]["100000"].water_yesterday = 250
+        self.assertEqual(self.store.flush(mydata), 1)
+        self.assertEqual(StateStore(self.path).load()["devices"]["100000"].water_yesterday, 250)
+
+    def test_removed_values_are_deleted(self):
+        # the layout of a version with only one account, the values move to accounts[""]
+        mydata = {"token": "abc", "last_err_id": "17", "day_today": "5", "devices": {}}
+        self.store.flush(mydata)
+        store = StateStore(self.path)
+        mydata = store.load()
+        mydata["accounts"] = {"": {key: mydata.pop(key) for key in ("token", "last_err_id", "day_today")}}
+        self.assertEqual(store.flush(mydata), 4)
+        self.assertEqual(self.rows(), {("general", "accounts")})
+        self.assertEqual(StateStore(self.path).load(), {"accounts": {"": {"token": "abc", "last_err_id": "17", "day_today": "5"}}, "devices": {}})
+
+
+if __name__ == "__main__":
+    unittest.main()